@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+from configparser import ConfigParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench import cache_server
+
+# Crawl throughput benchmark against the local cache simulator.
+#
+#   python -m bench.benchmark --threads 1,2,4,8
+#
+# Every thread count crawls the whole synthetic graph from scratch in its own
+# process (the scraper keeps module level state), reporting pages/sec and
+# peak RSS. With --shards N every crawl is split over N processes that
+# forward urls to each other through a spool directory. The hot paths of
+# scraper.py and crawler/frontier.py are timed on their own first: parse
+# ms/page and frontier ops/sec.
+
+
+def make_config(save_dir, threads, politeness, cache_address, overrides=()):
+    from utils.config import Config
+    cparser = ConfigParser()
+    cparser.read(os.path.join(ROOT, "config.ini"))
+    cparser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(save_dir, "frontier.db")
+    cparser["LOCAL PROPERTIES"]["THREADCOUNT"] = str(threads)
+    cparser["CRAWLER"]["POLITENESS"] = str(politeness)
+    for option in overrides:
+        key, value = option.split("=", 1)
+        section, key = key.rsplit(".", 1)
+        cparser[section][key] = value
+    config = Config(cparser)
+    config.cache_server = cache_address
+    return config
+
+
+def bench_parse(graph, pages=200):
+    ''' Average milliseconds to analyze one page of the graph. '''
+    from utils.page_analysis import analyze_page
+    urls = [f"https://{host}/page/{i}" for i in range(pages // 4) for host in cache_server.HOSTS[:4]]
+    documents = [(url, graph.page(url)[1].encode("utf-8")) for url in urls]
+    start = time.perf_counter()
+    for url, content in documents:
+        analyze_page(url, content)
+    return (time.perf_counter() - start) * 1000 / len(documents)
+
+
+def bench_decode(graph, responses=2000):
+    ''' Microseconds to decode one cache server response and get its status
+        and content, for a pickled and a plain 200 and for a 404. '''
+    import cbor
+    from utils.response import Response
+    url = f"https://{cache_server.HOSTS[0]}/page/1"
+    html = graph.page(url)[1]
+    timings = dict()
+    for name, body in (
+            ("pickle", cache_server.make_response(url, 200, html)),
+            ("plain", cache_server.make_response(url, 200, html, plain=True)),
+            ("404", cache_server.make_response(url, 404, ""))):
+        start = time.perf_counter()
+        for _ in range(responses):
+            resp = Response(cbor.loads(body))
+            if resp.status == 200:
+                resp.content
+        timings[name] = (time.perf_counter() - start) * 1e6 / responses
+    return timings
+
+
+def bench_frontier(save_dir, operations=20000):
+    ''' Frontier add_url, get_tbd_url and mark_url_complete calls per second. '''
+    from crawler.frontier import Frontier
+    config = make_config(save_dir, 1, 0, None)
+    frontier = Frontier(config, True)
+    urls = [f"https://{cache_server.HOSTS[i % len(cache_server.HOSTS)]}/item/{i}" for i in range(operations)]
+    start = time.perf_counter()
+    for url in urls:
+        frontier.add_url(url)
+    added = time.perf_counter()
+    done = 0
+    while done < operations:
+        url = frontier.get_tbd_url()
+        if url is None:
+            break
+        frontier.mark_url_complete(url)
+        done += 1
+    end = time.perf_counter()
+    frontier.save.close()
+    return operations / (added - start), done / (end - added)
+
+
+def run_crawl(args):
+    ''' Runs one crawl in this process and writes its results to
+        result.json in the work directory. '''
+    os.chdir(args.work_dir)
+    host, port = args.cache_server.rsplit(":", 1)
+    config = make_config(args.work_dir, args.threads, args.politeness, (host, int(port)), args.set)
+    from crawler import Crawler
+    import scraper
+    start = time.perf_counter()
+    crawler = Crawler(config, True)
+    crawler.start_async()
+    deadline = start + args.max_seconds
+    for worker in crawler.workers:
+        worker.join(max(0, deadline - time.perf_counter()))
+    seconds = time.perf_counter() - start
+    # Workers that timed out have not merged their counts yet
+    scraper.merge_stats()
+    with open(os.path.join(args.work_dir, "result.json"), "w") as file:
+        json.dump({
+            "threads": args.threads,
+            "seconds": seconds,
+            "pages": scraper.count,
+            "timed_out": any(worker.is_alive() for worker in crawler.workers),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }, file)
+    os._exit(0)
+
+
+def main(args):
+    server = cache_server.start(
+        0, args.pages_per_host, args.latency, plain=args.plain, capacity=args.capacity)
+    address = "%s:%d" % server.server_address
+    print(f"Cache simulator on {address}, {len(cache_server.HOSTS)} hosts, "
+          f"{args.pages_per_host} pages per host, {args.latency * 1000:g} ms latency")
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        print(f"parse:    {bench_parse(server.graph):.2f} ms/page")
+        print("decode:   " + ", ".join(
+            f"{name} {micros:.1f} us" for name, micros in bench_decode(server.graph).items()))
+        add_rate, pop_rate = bench_frontier(save_dir)
+        print(f"frontier: {add_rate:,.0f} add_url/s, {pop_rate:,.0f} get+complete/s")
+
+    print(f"{'threads':>7} {'requests':>8} {'503s':>6} {'pages':>6} {'seconds':>8} {'req/s':>8} {'peak MB':>8}")
+    for threads in args.threads:
+        server.requests = 0
+        server.rejected = 0
+        with tempfile.TemporaryDirectory() as work_dir:
+            # One process per shard, each in its own directory, all sharing
+            # the spool directory
+            processes = []
+            for shard in range(args.shards):
+                shard_dir = os.path.join(work_dir, f"shard-{shard}")
+                os.makedirs(shard_dir)
+                command = [
+                    sys.executable, "-m", "bench.benchmark", "--run_crawl",
+                    "--work_dir", shard_dir, "--cache_server", address,
+                    "--threads", str(threads), "--politeness", str(args.politeness),
+                    "--max_seconds", str(args.max_seconds),
+                    "--set", f"SHARDING.SHARD_ID={shard}",
+                    "--set", f"SHARDING.SHARD_COUNT={args.shards}",
+                    "--set", f"SHARDING.ADDRESS={os.path.join(work_dir, 'spool')}"]
+                for option in args.set:
+                    command += ["--set", option]
+                processes.append(subprocess.Popen(
+                    command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            results = []
+            for shard, process in enumerate(processes):
+                process.wait()
+                with open(os.path.join(work_dir, f"shard-{shard}", "result.json")) as file:
+                    results.append(json.load(file))
+        requests = server.requests
+        pages = sum(result["pages"] for result in results)
+        seconds = max(result["seconds"] for result in results)
+        peak_rss_mb = max(result["peak_rss_mb"] for result in results)
+        print(f"{threads:>7} {requests:>8} {server.rejected:>6} {pages:>6} {seconds:>8.2f} "
+              f"{requests / seconds:>8.1f} {peak_rss_mb:>8.1f}"
+              + ("  (timed out)" if any(result["timed_out"] for result in results) else ""))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--threads", type=lambda value: [int(t) for t in value.split(",")], default=[1, 2, 4, 8])
+    parser.add_argument("--pages_per_host", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument("--capacity", type=int, default=0, help="concurrent requests the simulator serves before answering 503")
+    parser.add_argument("--politeness", type=float, default=0.05)
+    parser.add_argument("--max_seconds", type=float, default=300)
+    parser.add_argument("--set", action="append", default=[], help="config override, e.g. CRAWLER.PARSER=lxml")
+    parser.add_argument("--plain", action="store_true", help="cache simulator sends content and headers instead of a pickle")
+    parser.add_argument("--shards", type=int, default=1, help="crawl with this many sharded processes")
+    parser.add_argument("--run_crawl", action="store_true")
+    parser.add_argument("--work_dir")
+    parser.add_argument("--cache_server")
+    args = parser.parse_args()
+    if args.run_crawl:
+        args.threads = args.threads[0]
+        run_crawl(args)
+    else:
+        main(args)
@@ -0,0 +1,220 @@
+import re
+import time
+import pickle
+import random
+import hashlib
+from argparse import ArgumentParser
+from threading import Thread, Lock
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import cbor
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# Local stand-in for the spacetime cache server. It answers the same
+# GET /?q=<url>&u=<user agent> requests with a cbor encoded dict holding the
+# url, the status and a pickled requests.Response, just like the real cache
+# (or with --plain the content and headers as they are, no pickle),
+# for a synthetic web graph that is generated from the url itself.
+
+HOSTS = (
+    ["www.ics.uci.edu", "www.cs.uci.edu", "www.informatics.uci.edu", "www.stat.uci.edu"]
+    + [f"lab{i}.ics.uci.edu" for i in range(32)])
+VOCABULARY_SIZE = 5000
+DAY = re.compile(r"^/events/(\d{4})-(\d{2})-(\d{2})$")
+
+
+class WebGraph(object):
+    ''' Deterministic synthetic site of pages_per_host pages on every host.
+
+        Besides regular pages it has the things a crawler has to cope with:
+        an event calendar trap that links one day to the next, printer
+        friendly exact duplicates, revision pages that only differ by a
+        timestamp, very large pages and links to pages that do not exist,
+        which every host's robots.txt disallows. '''
+
+    def __init__(self, pages_per_host=50, seed=0):
+        self.pages_per_host = pages_per_host
+        self.seed = seed
+        rng = random.Random(seed)
+        self.vocabulary = [
+            ''.join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 10)))
+            for _ in range(VOCABULARY_SIZE)]
+        # Zipf like word weights, the way natural text is distributed
+        self.weights = [1 / (rank + 1) for rank in range(VOCABULARY_SIZE)]
+
+    def seeds(self):
+        return [f"https://{host}" for host in HOSTS[:4]]
+
+    def _rng(self, key):
+        digest = hashlib.sha256(f"{self.seed}:{key}".encode("utf-8")).digest()
+        return random.Random(int.from_bytes(digest[:8], "big"))
+
+    def _text(self, rng, words):
+        return ' '.join(rng.choices(self.vocabulary, self.weights, k=words))
+
+    def _page_url(self, rng):
+        host = rng.choice(HOSTS)
+        return f"https://{host}/page/{rng.randrange(self.pages_per_host)}"
+
+    def _html(self, title, text, links):
+        anchors = ''.join(f'<li><a href="{link}">{link}</a></li>' for link in links)
+        return (
+            f"<html><head><title>{title}</title>"
+            f"<style>body {{ font-family: serif; }}</style></head>"
+            f"<body><h1>{title}</h1><p>{text}</p><ul>{anchors}</ul></body></html>")
+
+    def page(self, url):
+        ''' Returns (status, html) for the url. '''
+        parsed = urlparse(url)
+        host, path = parsed.netloc, parsed.path.rstrip("/") or "/"
+        if host not in HOSTS:
+            return 404, ""
+        rng = self._rng(f"{host}{path}")
+
+        if path == "/robots.txt":
+            return 200, "User-agent: *\nDisallow: /missing/\n"
+        if path == "/":
+            links = [f"https://{host}/page/{i}" for i in range(min(10, self.pages_per_host))]
+            links += [f"https://{other}" for other in HOSTS]
+            links.append(f"https://{host}/events/2020-01-01")
+            return 200, self._html(host, self._text(rng, 200), links)
+
+        match = DAY.match(path)
+        if match:
+            # Calendar trap: every day links to the next one, for 10 years
+            year, month, day = (int(part) for part in match.groups())
+            if year >= 2030:
+                return 404, ""
+            day += 1
+            if day > 28:
+                day, month = 1, month + 1
+            if month > 12:
+                month, year = 1, year + 1
+            links = [f"https://{host}/events/{year:04d}-{month:02d}-{day:02d}"]
+            return 200, self._html("Events", self._text(rng, 30), links)
+
+        parts = path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] in ("page", "print", "rev") and parts[1].isdigit():
+            number = int(parts[1])
+            if number >= self.pages_per_host:
+                return 404, ""
+            page_rng = self._rng(f"{host}/page/{number}")
+            # One page in 25 is very large
+            words = 20000 if number % 25 == 0 else page_rng.randint(100, 1500)
+            text = self._text(page_rng, words)
+            links = [self._page_url(page_rng) for _ in range(page_rng.randint(5, 30))]
+            links.append(f"https://{host}/print/{number}")
+            links.append(f"https://{host}/rev/{number}?rev={page_rng.randrange(10 ** 9)}")
+            links.append(f"https://{host}/missing/{number}")
+            if parts[0] == "rev":
+                # Same page with a different timestamp, a near duplicate
+                text = f"Revision {parsed.query} saved {time.time()} {text}"
+            return 200, self._html(f"Page {number}", text, links)
+        return 404, ""
+
+
+def make_response(url, status, html, plain=False):
+    if plain:
+        return cbor.dumps({
+            "url": url, "status": status, "content": html.encode("utf-8"),
+            "headers": {"Content-Type": "text/html; charset=utf-8"}})
+    raw = requests.models.Response()
+    raw.status_code = status
+    raw.url = url
+    raw._content = html.encode("utf-8")
+    raw.encoding = "utf-8"
+    raw.headers = CaseInsensitiveDict({"Content-Type": "text/html; charset=utf-8"})
+    return cbor.dumps({"url": url, "status": status, "response": pickle.dumps(raw)})
+
+
+class CacheServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, graph, latency=0.0, plain=False, capacity=0):
+        super().__init__(address, CacheHandler)
+        self.graph = graph
+        self.latency = latency
+        self.plain = plain
+        # Requests served at the same time before answering 503, 0 = no limit
+        self.capacity = capacity
+        self.active = 0
+        self.requests = 0
+        self.rejected = 0
+        self.lock = Lock()
+
+    def count(self):
+        with self.lock:
+            self.requests += 1
+
+    def admit(self):
+        with self.lock:
+            if self.capacity and self.active >= self.capacity:
+                self.rejected += 1
+                return False
+            self.active += 1
+            return True
+
+    def leave(self):
+        with self.lock:
+            self.active -= 1
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, don't let Nagle's algorithm
+    # hold the body back on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        params = parse_qs(urlparse(self.path).query)
+        if "q" not in params or "u" not in params:
+            self.send_error(400, "Expected q and u parameters")
+            return
+        url = params["q"][0]
+        self.server.count()
+        if not self.server.admit():
+            self.send_error(503, "Over capacity")
+            return
+        try:
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            status, html = self.server.graph.page(url)
+            body = make_response(url, status, html, self.server.plain)
+        finally:
+            self.server.leave()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/cbor")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(port=0, pages_per_host=50, latency=0.0, seed=0, plain=False, capacity=0):
+    ''' Starts the cache server in a background thread and returns it.
+        server.server_address holds the (host, port) it listens on. '''
+    server = CacheServer(
+        ("127.0.0.1", port), WebGraph(pages_per_host, seed), latency, plain, capacity)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--pages_per_host", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--plain", action="store_true", help="send content and headers instead of a pickle")
+    parser.add_argument("--capacity", type=int, default=0, help="concurrent requests before answering 503")
+    args = parser.parse_args()
+    server = CacheServer(
+        ("127.0.0.1", args.port), WebGraph(args.pages_per_host, args.seed), args.latency,
+        args.plain, args.capacity)
+    print(f"Serving the synthetic web graph on 127.0.0.1:{args.port}, "
+          f"crawl it with: python launch.py --cache_server 127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -1,16 +1,40 @@
 from utils import get_logger
 from crawler.frontier import Frontier
+from crawler.shard import ShardedFrontier
 from crawler.worker import Worker
+from crawler import pipeline
+from utils import metrics, robots, archive, report
+import scraper
 
 class Crawler(object):
     def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
         self.config = config
         self.logger = get_logger("CRAWLER")
+        scraper.configure(config, restart)
+        if config.shard_count > 1 and frontier_factory is Frontier:
+            frontier_factory = ShardedFrontier
+            self.logger.info(
+                f"Crawling shard {config.shard_id} of {config.shard_count}.")
         self.frontier = frontier_factory(config, restart)
+        robots.start(config, getattr(self.frontier, "set_host_delay", None))
         self.workers = list()
         self.worker_factory = worker_factory
 
     def start_async(self):
+        if self.config.metrics_port:
+            metrics.serve(self.config.metrics_port)
+            self.logger.info(
+                f"Serving metrics on http://127.0.0.1:{self.config.metrics_port}/metrics")
+        if self.config.metrics_interval > 0:
+            metrics.start_reporter(self.logger, self.config.metrics_interval)
+        report.start(
+            self.config, scraper.report_data,
+            lambda: metrics.metrics.get("pages_counted"))
+        if archive.start(self.config):
+            self.logger.info(f"Archiving pages to {self.config.archive}.")
+        if pipeline.start(self.config):
+            self.logger.info(
+                f"Analyzing pages in {self.config.parse_processes} processes.")
         self.workers = [
             self.worker_factory(worker_id, self.config, self.frontier)
             for worker_id in range(self.config.threads_count)]
@@ -24,3 +48,8 @@ class Crawler(object):
     def join(self):
         for worker in self.workers:
             worker.join()
+        pipeline.shutdown()
+        archive.stop()
+        report.stop()
+        # The final reports, once for all workers
+        scraper.record_data()
@@ -1,19 +1,79 @@
 import os
+import dbm
+import time
+import zlib
+import heapq
+import atexit
+import pickle
 import shelve
 
-from threading import Thread, RLock
+from threading import Thread, RLock, Condition
 from queue import Queue, Empty
+from urllib.parse import urlparse
 
 from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils.metrics import metrics
+import scraper
+from scraper import is_crawlable
+from crawler.store import FrontierStore
+from crawler.priority import HostQueue, make_scorer
+from crawler.refresh import RefreshScheduler
+from crawler.politeness import PolitenessController
+
+# Form of the urls in the save file, 1 is canonicalize()
+URL_VERSION = 1
 
 class Frontier(object):
+    idle_wait = None
+
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
-        
-        if not os.path.exists(self.config.save_file) and not restart:
+        # All frontier state is guarded by this lock. Workers block on the
+        # condition until a host becomes ready or new urls are added.
+        self.lock = RLock()
+        self.ready = Condition(self.lock)
+        # One queue of urls to be downloaded per host, ordered by the scorer
+        # (FRONTIER_PRIORITY in config.ini).
+        self.host_queues = dict()
+        self.scorer = make_scorer(config)
+        # Heap of (ready_time, host) for hosts that have queued urls and are
+        # not currently being fetched.
+        self.host_heap = list()
+        self.scheduled_hosts = set()
+        # Hosts that a worker is currently downloading from.
+        self.busy_hosts = set()
+        # Earliest time each host may be fetched again (politeness clock).
+        self.host_next_fetch = dict()
+        # Delay of every host and the number of downloads at a time, adapted
+        # to how the cache server responds.
+        self.politeness = PolitenessController(config)
+        self.tbd_count = 0
+        self.in_flight = 0
+        # At most window urls are queued in memory, the others wait in the
+        # save file until the queues run low (FRONTIER_WINDOW, 0 = no limit).
+        self.window = self.config.frontier_window
+        self.waiting = 0
+        # Number of times each url was handed back without being completed.
+        self.attempts = dict()
+        # Schedules the next visit of every downloaded url, for --refresh.
+        self.refresh = RefreshScheduler(config)
+
+        metrics.register_gauge("frontier_queue_depth", lambda: self.tbd_count)
+        metrics.register_gauge("frontier_waiting", lambda: self.waiting)
+        metrics.register_gauge("frontier_in_flight", lambda: self.in_flight)
+        metrics.register_gauge("frontier_hosts", lambda: len(self.host_queues))
+        metrics.register_gauge("politeness_concurrency", self.politeness.limit)
+        metrics.register_gauge(
+            "politeness_delay_seconds", lambda: dict(self.politeness.host_delays),
+            label="host")
+        metrics.register_gauge(
+            "frontier_host_backlog",
+            lambda: {host: len(queue) for host, queue in list(self.host_queues.items())},
+            label="host")
+
+        imported = None if restart else self._read_shelve()
+        if not os.path.exists(self.config.save_file) and not restart and imported is None:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
@@ -22,51 +82,351 @@ class Frontier(object):
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
+            FrontierStore.remove(self.config.save_file)
+        self.seen_file = self.config.save_file + ".seen"
+        if restart and os.path.exists(self.seen_file):
+            os.remove(self.seen_file)
         # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
+        self.save = FrontierStore(
+            self.config.save_file, self.config.save_batch,
+            self.config.save_interval, self.config.save_sync,
+            # Pages counted for the urls a batch completes reach the
+            # checkpoint first, or a crash would leave them uncounted
+            before_flush=scraper.flush_checkpoint)
+        if imported is not None:
+            path, entries = imported
+            for urlhash, (url, completed) in entries:
+                self.save.insert(urlhash, url, completed, queued=False)
+            self.save.flush()
+            self.logger.info(f"Imported {len(entries)} urls from the shelve {path}.")
+        # Save files from before canonicalize() hold urls in another form
+        rewritten = self.save.rewrite_urls(self._canonical, URL_VERSION)
+        if rewritten:
+            self.logger.info(f"Rewrote {rewritten} urls in their canonical form.")
+            # The seen filter has their old forms, rebuild it
+            if os.path.exists(self.seen_file):
+                os.remove(self.seen_file)
+        # Registered after the store, so it runs before the store closes.
+        atexit.register(self._save_seen)
         if restart:
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
             # Set the frontier state with contents of save file.
-            self._parse_save_file()
+            with self.lock:
+                self._load_seen()
+                if self.config.refresh:
+                    due = self.save.reschedule(time.time())
+                    self.logger.info(f"Refreshing {due} urls that are due for a visit.")
+                self._parse_save_file()
             if not self.save:
                 for url in self.config.seed_urls:
                     self.add_url(url)
 
+    def _read_shelve(self):
+        # Progress of the shelve based frontier, from SAVE or else from the
+        # old default name next to it (SAVE with a .shelve extension), unless
+        # SAVE is a store already. Returns (path, [(urlhash, (url,
+        # completed))]) or None. A shelve file at SAVE itself is moved to
+        # SAVE with .old appended, to make room for the store.
+        save_file = self.config.save_file
+        if os.path.exists(save_file):
+            with open(save_file, "rb") as file:
+                if file.read(16) == b"SQLite format 3\x00":
+                    # Already a store
+                    return None
+        kind = dbm.whichdb(save_file)
+        path = save_file if kind else os.path.splitext(save_file)[0] + ".shelve"
+        if not dbm.whichdb(path):
+            return None
+        try:
+            with shelve.open(path, "r") as old:
+                entries = list(old.items())
+        except Exception:
+            self.logger.exception(
+                f"Found the shelve save file {path} but could not read it. "
+                f"Use --restart to start from the seeds instead.")
+            raise
+        if path == save_file and os.path.exists(save_file):
+            os.replace(save_file, save_file + ".old")
+        return path, entries
+
     def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
+        ''' This function can be overridden for alternate saving techniques.
+            Urls are only counted here and loaded lazily by _refill. '''
         total_count = len(self.save)
-        tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        self.save.reset_queued()
+        self.waiting = self.save.waiting()
+        self._refill()
+        self.logger.info(
+            f"Found {self.waiting + self.tbd_count} urls to be downloaded "
+            f"from {total_count} total urls discovered.")
+
+    def _save_seen(self):
+        # Saves the seen url filter with the rowid of the last url it has,
+        # so a resume only adds the urls stored after it.
+        with self.lock:
+            if self.save.closed.is_set():
+                return
+            rowid = self.save.last_rowid()
+            tmp_path = self.seen_file + ".tmp"
+            with open(tmp_path, "wb") as file:
+                pickle.dump((rowid, scraper.visited_urls), file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.seen_file)
+
+    def _load_seen(self):
+        rowid = 0
+        if os.path.exists(self.seen_file):
+            try:
+                with open(self.seen_file, "rb") as file:
+                    rowid, scraper.visited_urls = pickle.load(file)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self.logger.error(
+                    f"Could not read {self.seen_file}, rebuilding it.")
+                rowid = 0
+        added = 0
+        for url in self.save.urls_since(rowid):
+            scraper.visited_urls.add(url)
+            added += 1
         self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+            f"Loaded {len(scraper.visited_urls)} seen urls, "
+            f"{added} of them from the save file.")
+
+    def _refill(self):
+        # Moves the best scored urls waiting on disk into memory once fewer
+        # than half a window are queued.
+        if not self.waiting or (self.window and self.tbd_count >= self.window // 2):
+            return
+        limit = self.window - self.tbd_count if self.window else self.waiting
+        taken = self.save.take(limit)
+        self.waiting = max(0, self.waiting - len(taken)) if taken else 0
+        for url, score in taken:
+            # Rules may have changed or blocked the url since it was stored
+            if is_crawlable(url):
+                self._enqueue(url, score)
+
+    @staticmethod
+    def _canonical(url):
+        url = normalize(url)
+        return get_urlhash(url), url
+
+    @staticmethod
+    def _get_host(url):
+        return urlparse(url).netloc.lower()
+
+    def _schedule_host(self, host):
+        # Put the host on the ready heap if it has work and is not already
+        # scheduled or being fetched.
+        if (host in self.scheduled_hosts or host in self.busy_hosts
+                or not self.host_queues.get(host)):
+            return
+        heapq.heappush(
+            self.host_heap, (self.host_next_fetch.get(host, 0), host))
+        self.scheduled_hosts.add(host)
+        self.ready.notify()
+
+    def _enqueue(self, url, score=None):
+        host = self._get_host(url)
+        if host not in self.host_queues:
+            self.host_queues[host] = HostQueue()
+        if score is None:
+            score = self.scorer.score(url)
+        else:
+            self.scorer.restored(url, score)
+        self.host_queues[host].push(url, score)
+        self.tbd_count += 1
+        self._schedule_host(host)
 
     def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+        ''' Blocks until a url whose host may be fetched is available.
+            Returns None when the frontier is empty and no download is in
+            progress that could add more urls. '''
+        with self.lock:
+            while True:
+                self._refill()
+                if self.host_heap and self.in_flight >= self.politeness.limit():
+                    # Backing off from the cache server, fewer downloads at a time
+                    self.ready.wait()
+                elif self.host_heap:
+                    ready_time, host = self.host_heap[0]
+                    wait = ready_time - time.monotonic()
+                    if wait <= 0:
+                        heapq.heappop(self.host_heap)
+                        self.scheduled_hosts.discard(host)
+                        url = self.host_queues[host].pop()
+                        self.scorer.popped(url)
+                        if not self.host_queues[host]:
+                            del self.host_queues[host]
+                        self.busy_hosts.add(host)
+                        self.tbd_count -= 1
+                        self.in_flight += 1
+                        return url
+                    self.ready.wait(wait)
+                elif self.in_flight == 0:
+                    if self._finished():
+                        # Nothing left to crawl, make sure everything is on disk.
+                        self.save.flush()
+                        return None
+                    self.ready.wait(self.idle_wait)
+                else:
+                    self.ready.wait()
+
+    def _finished(self):
+        ''' Called when nothing is queued or being downloaded. This function
+            can be overridden for frontiers that can get urls from elsewhere,
+            which are then waited for idle_wait seconds at a time. '''
+        return True
 
     def add_url(self, url):
         url = normalize(url)
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-    
+        with self.lock:
+            # The filter has no false negatives, so urls it has not seen are
+            # new and only the others need the exact check in the save file.
+            if url in scraper.visited_urls:
+                if urlhash in self.save:
+                    metrics.inc("frontier_duplicates")
+                    self._linked(url)
+                    return
+                metrics.inc("seen_filter_false_positives")
+            scraper.visited_urls.add(url)
+            self._store(url, urlhash)
+
+    def _store(self, url, urlhash):
+        # Stores a new url and queues it, or leaves it waiting on disk.
+        if self.window and self.tbd_count >= self.window:
+            # Memory is full, the url waits on disk with its score
+            score = self.scorer.score(url)
+            self.scorer.popped(url)
+            self.save.insert(urlhash, url, False, score, queued=False)
+            self.waiting += 1
+            return
+        self.save.insert(urlhash, url, False)
+        self._enqueue(url)
+
+    def _linked(self, url):
+        # Another link to a url that may still be queued, which can raise
+        # its priority. Returns whether it is queued.
+        queue = self.host_queues.get(self._get_host(url))
+        if queue is None or url not in queue:
+            return False
+        score = self.scorer.linked(url)
+        if score is not None:
+            queue.rescore(url, score)
+        return True
+
+    def linked(self, urls):
+        ''' Links to urls that visited_urls has seen before. Those still
+            queued can move up, the others are checked in the save file and
+            added after all if the filter was wrong about them. '''
+        unseen = list()
+        with self.lock:
+            for url in urls:
+                url = normalize(url)
+                if not self._linked(url) and get_urlhash(url) not in self.save:
+                    unseen.append(url)
+        # Through add_url, which subclasses may route elsewhere
+        for url in unseen:
+            if is_crawlable(url):
+                self.add_url(url)
+
+    def add_redirect(self, url):
+        ''' Stores the url a download was redirected to as completed, so
+            links to it are not downloaded again. '''
+        url = normalize(url)
+        urlhash = get_urlhash(url)
+        with self.lock:
+            scraper.visited_urls.add(url)
+            if urlhash not in self.save:
+                self.save[urlhash] = (url, True)
+
+    def _release_host(self, url, wait=0):
+        # Start the host's politeness clock once its download has finished,
+        # waiting at least wait seconds.
+        host = self._get_host(url)
+        self.host_next_fetch[host] = time.monotonic() + max(wait, self.politeness.delay(host))
+        if host in self.busy_hosts:
+            self.busy_hosts.discard(host)
+            self.in_flight -= 1
+        self._schedule_host(host)
+        # Wake everyone up so idle workers can notice an empty frontier.
+        self.ready.notify_all()
+
+    def set_host_delay(self, host, seconds):
+        ''' Waits at least seconds between downloads from the host, but never
+            less than POLITENESS. '''
+        with self.lock:
+            self.politeness.set_floor(host.lower(), seconds)
+
+    def observe(self, url, status, seconds):
+        ''' Reports how a download of the url went, before it is completed
+            or released: its status (None if it failed) and how long it
+            took. Adapts the politeness to it. '''
+        with self.lock:
+            before = self.politeness.backoffs
+            self.politeness.observe(self._get_host(url), status, seconds)
+            if self.politeness.backoffs > before:
+                metrics.inc("politeness_backoffs")
+
+    def release_url(self, url):
+        ''' Hands back a url from get_tbd_url that could not be downloaded.
+            It is queued again unless it failed max_attempts times already,
+            in which case it is left incomplete for the next resume. '''
+        with self.lock:
+            attempts = self.attempts.get(url, 0) + 1
+            if attempts < self.config.max_attempts:
+                self.attempts[url] = attempts
+                self._enqueue(url)
+            else:
+                self.attempts.pop(url, None)
+                self.logger.error(f"Giving up on {url} after {attempts} attempts.")
+            self._release_host(url)
+
+    def defer_url(self, url, seconds):
+        ''' Hands back a url from get_tbd_url that cannot be downloaded yet.
+            It is queued again without counting as an attempt and its host
+            is not fetched again for seconds. '''
+        with self.lock:
+            self._enqueue(url)
+            self._release_host(url, seconds)
+
+    def check_visit(self, url, resp):
+        ''' Returns (Visit, changed) for a download of the url: its
+            validators and content hash, when to visit it again and whether
+            the page changed since its last visit. Nothing is stored until
+            record_visit(). '''
+        previous = self.save.visit(get_urlhash(url))
+        return self.refresh.visit(previous, resp, time.time())
+
+    def record_visit(self, url, visit):
+        ''' Stores the Visit from check_visit(). Called once the links of
+            the page are stored, so a page whose visit is recorded never
+            needs analysis again unless it changes. '''
+        self.save.record_visit(get_urlhash(url), visit)
+
+    def record_page(self, url, page):
+        ''' Stores the page the scraper counted for the url, None if it
+            counted none. '''
+        data = None
+        if page is not None:
+            data = zlib.compress(pickle.dumps(page, protocol=pickle.HIGHEST_PROTOCOL))
+        self.save.record_page(get_urlhash(url), data)
+
+    def counted_page(self, url):
+        ''' The page the scraper counted for the url on its last visit, or
+            None. '''
+        data = self.save.page(get_urlhash(url))
+        return pickle.loads(zlib.decompress(data)) if data is not None else None
+
     def mark_url_complete(self, url):
         urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
+        with self.lock:
+            if urlhash not in self.save:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
 
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+            self.save[urlhash] = (url, True)
+            self.attempts.pop(url, None)
+            self._release_host(url)
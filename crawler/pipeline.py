@@ -0,0 +1,60 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.page_analysis import analyze_page
+from utils.simhash import simhash
+from scraper import page_word_counts
+
+# Optional pool of processes that parse and tokenize pages so that the
+# download threads are not limited by the GIL. None means pages are analyzed
+# on the worker thread that downloaded them.
+_executor = None
+
+
+def start(config):
+    ''' Starts the analysis pool if PARSE_PROCESSES is set in config.ini. '''
+    global _executor
+    if config.parse_processes > 0 and _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=config.parse_processes)
+    return _executor
+
+
+def _analyze(url, content, backend):
+    # Parses the page and fingerprints and counts its words, all in the pool
+    analysis = analyze_page(url, content, backend)
+    analysis.simhash = simhash(analysis.words)
+    analysis.word_counts = page_word_counts(analysis.words)
+    return analysis
+
+
+def analyze(url, content, backend="html.parser"):
+    ''' Returns the PageAnalysis for the page with its SimHash and word
+        counts, computed in the pool when it is running. The calling thread waits without holding the GIL. '''
+    if _executor is None:
+        return _analyze(url, content, backend)
+    return _executor.submit(_analyze, url, bytes(content), backend).result()
+
+
+def analyze_many(items, backend="html.parser", window=64):
+    ''' Yields (item, PageAnalysis) for the (item, url, content) triples in
+        order. With the pool running, up to window pages are analyzed ahead. '''
+    if _executor is None:
+        for item, url, content in items:
+            yield item, _analyze(url, content, backend)
+        return
+    futures = deque()
+    for item, url, content in items:
+        futures.append((item, _executor.submit(_analyze, url, bytes(content), backend)))
+        if len(futures) >= window:
+            item, future = futures.popleft()
+            yield item, future.result()
+    while futures:
+        item, future = futures.popleft()
+        yield item, future.result()
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True)
+        _executor = None
@@ -0,0 +1,90 @@
+class PolitenessController(object):
+    ''' Adapts the delay between downloads from each host, and the number
+        of downloads in flight at the cache server as a whole, to how the
+        cache server responds (AIMD).
+
+        A 5xx, 429 or failed download multiplies the host's delay by
+        backoff, up to max_delay, and halves the number of concurrent
+        downloads. A response that is no slower than slow_factor times the
+        usual latency takes step seconds off the host's delay and lets one
+        more download run at a time about every concurrency responses. A
+        slow response changes nothing. A host never waits less than
+        POLITENESS or its robots.txt Crawl-delay.
+
+        Not thread safe, the frontier calls it with its lock held. '''
+
+    slow_factor = 3.0
+    # Delay the first backoff starts from when POLITENESS is 0
+    min_backoff = 0.25
+    # Weight of a new latency sample in the moving averages
+    alpha = 0.1
+
+    def __init__(self, config):
+        self.floor = config.time_delay
+        self.max_delay = max(config.politeness_max, self.floor)
+        self.step = config.politeness_step
+        self.backoff = config.politeness_backoff
+        self.max_concurrency = max(1, config.threads_count)
+        self.concurrency = float(self.max_concurrency)
+        # host -> minimum delay above the floor, from Crawl-delay
+        self.host_floors = dict()
+        # host -> current delay, only for hosts above their minimum
+        self.host_delays = dict()
+        # host -> moving average of the download latency
+        self.host_latency = dict()
+        self.latency = None
+        self.backoffs = 0
+
+    def set_floor(self, host, seconds):
+        if seconds > self.floor:
+            self.host_floors[host] = seconds
+        else:
+            self.host_floors.pop(host, None)
+
+    def _floor(self, host):
+        return self.host_floors.get(host, self.floor)
+
+    def delay(self, host):
+        ''' Seconds to wait after a download from host before the next. '''
+        return self.host_delays.get(host) or self._floor(host)
+
+    def limit(self):
+        ''' Downloads that may be in flight at the same time. '''
+        return int(self.concurrency)
+
+    def _error(self, host):
+        self.backoffs += 1
+        delay = max(self.delay(host), self.min_backoff)
+        self.host_delays[host] = min(self.max_delay, delay * self.backoff)
+        self.concurrency = max(1.0, self.concurrency / 2)
+
+    def _slow(self, host, seconds):
+        average = self.host_latency.get(host, self.latency)
+        return average is not None and seconds > self.slow_factor * average
+
+    def _success(self, host):
+        delay = self.host_delays.get(host)
+        if delay is not None:
+            delay -= self.step
+            if delay <= self._floor(host):
+                del self.host_delays[host]
+            else:
+                self.host_delays[host] = delay
+        self.concurrency = min(
+            self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    def observe(self, host, status, seconds):
+        ''' Records a download from host that took seconds. status is the
+            HTTP status of the cache server, not of the page's origin, and
+            None if the download failed or timed out. '''
+        if status is None or status == 429 or 500 <= status < 600:
+            self._error(host)
+            return
+        if not self._slow(host, seconds):
+            self._success(host)
+        average = self.host_latency.get(host)
+        self.host_latency[host] = (
+            seconds if average is None else average + self.alpha * (seconds - average))
+        self.latency = (
+            seconds if self.latency is None
+            else self.latency + self.alpha * (seconds - self.latency))
@@ -0,0 +1,153 @@
+import heapq
+import itertools
+from math import log2
+from urllib.parse import urlparse
+
+from utils.traps import url_template
+
+
+class HostQueue(object):
+    ''' The urls of one host, lowest score first.
+
+        A url whose score improves is pushed again and its old heap entry is
+        skipped when it comes up (lazy deletion), so rescoring is O(log n). '''
+
+    def __init__(self):
+        self.heap = []
+        # url -> current score
+        self.scores = dict()
+        self.counter = itertools.count()
+
+    def push(self, url, score):
+        self.scores[url] = score
+        heapq.heappush(self.heap, (score, next(self.counter), url))
+
+    def rescore(self, url, score):
+        ''' Moves a queued url up if score is better than its current one. '''
+        if url in self.scores and score < self.scores[url]:
+            self.push(url, score)
+
+    def pop(self):
+        while True:
+            score, _, url = heapq.heappop(self.heap)
+            if self.scores.get(url) == score:
+                del self.scores[url]
+                return url
+
+    def __contains__(self, url):
+        return url in self.scores
+
+    def __len__(self):
+        return len(self.scores)
+
+
+class Scorer(object):
+    ''' Decides the order urls of a host are downloaded in; lower scores are
+        downloaded first. Hosts take turns regardless of scores, so this
+        only orders the urls within a host. Called with the frontier lock
+        held. '''
+
+    def __init__(self, config):
+        self.config = config
+        self.counter = itertools.count()
+
+    def score(self, url):
+        raise NotImplementedError
+
+    def linked(self, url):
+        ''' Called when another page links to a url that is still queued.
+            Returns its new score, or None if it does not change. '''
+        return None
+
+    def popped(self, url):
+        ''' Called when a url leaves the queue, or is stored on disk
+            instead of being queued. '''
+        pass
+
+    def restored(self, url, score):
+        ''' Called when a url comes back from disk with its stored score. '''
+        pass
+
+
+class LifoScorer(Scorer):
+    ''' Newest url first, the depth first order of the original frontier. '''
+
+    def score(self, url):
+        return -next(self.counter)
+
+
+class FifoScorer(Scorer):
+    ''' Oldest url first, breadth first. '''
+
+    def score(self, url):
+        return next(self.counter)
+
+
+class BestFirstScorer(Scorer):
+    ''' Prefers shallow urls, urls of templates that were rarely seen and
+        urls that many pages link to.
+
+        score = path depth + 1 for a query string
+                + log2(1 + urls queued with the same template)
+                - log2(in-degree)
+
+        so the 64th queued url of a calendar template waits behind six
+        levels of regular pages, while a page that 8 pages link to moves up
+        3 levels. Only urls queued in memory count towards their template
+        and only links found while the url is queued count towards its
+        in-degree. '''
+
+    def __init__(self, config):
+        super().__init__(config)
+        # template -> number of queued urls
+        self.templates = dict()
+        # url -> (score without in-degree, in-degree, template) of queued urls
+        self.queued = dict()
+
+    def _add_template(self, url, parsed=None):
+        template = url_template(url, parsed)
+        queued = self.templates.get(template, 0)
+        self.templates[template] = queued + 1
+        return template, queued
+
+    def score(self, url):
+        parsed = urlparse(url)
+        template, queued = self._add_template(url, parsed)
+        depth = len([segment for segment in parsed.path.split("/") if segment])
+        base = depth + (1 if parsed.query else 0) + log2(1 + queued)
+        self.queued[url] = (base, 1, template)
+        return base
+
+    def linked(self, url):
+        entry = self.queued.get(url)
+        if entry is None:
+            return None
+        base, in_degree, template = entry
+        self.queued[url] = (base, in_degree + 1, template)
+        return base - log2(in_degree + 1)
+
+    def popped(self, url):
+        entry = self.queued.pop(url, None)
+        if entry is not None:
+            template = entry[2]
+            queued = self.templates[template] - 1
+            if queued:
+                self.templates[template] = queued
+            else:
+                del self.templates[template]
+
+    def restored(self, url, score):
+        template, _ = self._add_template(url)
+        self.queued[url] = (score, 1, template)
+
+
+SCORERS = {
+    "best": BestFirstScorer,
+    "fifo": FifoScorer,
+    "lifo": LifoScorer,
+}
+
+
+def make_scorer(config):
+    ''' Scorer for FRONTIER_PRIORITY in config.ini. '''
+    return SCORERS.get(config.frontier_priority, BestFirstScorer)(config)
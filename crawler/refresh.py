@@ -0,0 +1,73 @@
+from hashlib import sha256
+from collections import namedtuple
+
+# What the last download of a url looked like, as stored in the save file.
+# interval is the current estimate of how often the page changes, in seconds.
+Visit = namedtuple(
+    "Visit", "etag last_modified content_hash visited interval next_visit")
+
+
+def _header(headers, name):
+    # requests' headers are case insensitive, plain dicts from the cache
+    # server may not be
+    value = headers.get(name)
+    if value is None:
+        value = headers.get(name.lower())
+    return value
+
+
+class RefreshScheduler(object):
+    ''' Decides whether a downloaded page changed since its last visit and
+        when it should be visited again.
+
+        A page changed if its content hash differs from the last one; for
+        responses without a body (304 Not Modified) the ETag and
+        Last-Modified validators decide. Every visit that finds the page
+        changed halves its revisit interval and every visit that finds it
+        unchanged doubles it, within REFRESH_MIN_INTERVAL and
+        REFRESH_MAX_INTERVAL, so static pages are soon only visited rarely
+        while pages that keep changing are visited often. '''
+
+    def __init__(self, config):
+        self.initial = config.refresh_interval
+        self.min_interval = config.refresh_min_interval
+        self.max_interval = config.refresh_max_interval
+
+    @staticmethod
+    def _changed(previous, etag, last_modified, content_hash, status):
+        if status == 304:
+            return False
+        if content_hash is not None and previous.content_hash is not None:
+            return content_hash != previous.content_hash
+        if etag is not None and previous.etag is not None:
+            return etag != previous.etag
+        if last_modified is not None and previous.last_modified is not None:
+            return last_modified != previous.last_modified
+        return content_hash != previous.content_hash
+
+    def visit(self, previous, resp, now):
+        ''' Returns (Visit, changed) for resp, a download of a url whose
+            last Visit was previous (None if it was never downloaded). '''
+        headers = resp.headers if resp.status in (200, 304) else {}
+        etag = _header(headers, "ETag")
+        last_modified = _header(headers, "Last-Modified")
+        content_hash = None
+        if resp.status == 200:
+            content = resp.content
+            if content is not None:
+                content_hash = sha256(content).hexdigest()
+
+        if previous is None:
+            interval, changed = self.initial, True
+        else:
+            previous = Visit._make(previous)
+            changed = self._changed(previous, etag, last_modified, content_hash, resp.status)
+            if changed:
+                interval = max(self.min_interval, previous.interval / 2)
+            else:
+                interval = min(self.max_interval, previous.interval * 2)
+                # A 304 has no body, keep what the last full download had
+                content_hash = content_hash or previous.content_hash
+                etag = etag or previous.etag
+                last_modified = last_modified or previous.last_modified
+        return Visit(etag, last_modified, content_hash, now, interval, now + interval), changed
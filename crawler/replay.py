@@ -0,0 +1,38 @@
+import time
+
+from utils import get_logger
+from utils.archive import PageArchive
+from utils.metrics import metrics
+from crawler import pipeline
+import scraper
+
+
+def replay(config):
+    ''' Feeds every page of the ARCHIVE back through the scraper, without
+        downloading anything, and writes the reports. The statistics start
+        from scratch, so they reflect the current scraper, and are not
+        checkpointed: the crawl's checkpoint is left as it is. '''
+    logger = get_logger("REPLAY")
+    archive = PageArchive(config.archive, config.archive_compression)
+    scraper.configure(config, restart=True, checkpoints=False)
+    if pipeline.start(config):
+        logger.info(f"Analyzing pages in {config.parse_processes} processes.")
+    logger.info(f"Replaying {len(archive)} pages from {config.archive}.")
+    started = time.monotonic()
+    pages = (
+        (page, page.final_url.split("#")[0], page.content)
+        for page in archive.pages() if page.status == 200)
+    replayed = 0
+    try:
+        for page, analysis in pipeline.analyze_many(pages, config.parser_backend):
+            scraper.scraper(page.url, page.response(), analysis)
+            metrics.inc("pages_replayed")
+            replayed += 1
+    finally:
+        pipeline.shutdown()
+        archive.close()
+    elapsed = time.monotonic() - started
+    logger.info(
+        f"Replayed {replayed} pages in {elapsed:.1f}s "
+        f"({replayed / max(elapsed, 1e-9):.1f} pages/s).")
+    scraper.record_data()
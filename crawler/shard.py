@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import uuid
+import itertools
+from bisect import bisect
+from threading import Thread, Lock
+from urllib.parse import urlparse
+
+from utils import get_logger, normalize
+from utils.bloom import key64
+from utils.metrics import metrics
+from crawler.frontier import Frontier
+
+
+class HashRing(object):
+    ''' Consistent hashing of hosts onto shard_count shards.
+
+        Every shard owns replicas points on a 64 bit ring and a host belongs
+        to the shard of the first point after its hash. All urls of a host
+        land on one shard, so its politeness is enforced in one place, and
+        changing the number of shards only moves about 1/shard_count of the
+        hosts. '''
+
+    def __init__(self, shard_count, replicas=64):
+        self.shard_count = shard_count
+        points = sorted(
+            (key64(f"shard-{shard}-{replica}"), shard)
+            for shard in range(shard_count) for replica in range(replicas))
+        self.points = [point for point, _ in points]
+        self.shards = [shard for _, shard in points]
+
+    def owner(self, host):
+        index = bisect(self.points, key64(host.lower())) % len(self.points)
+        return self.shards[index]
+
+
+class SpoolTransport(object):
+    ''' Moves url batches between crawler processes through a directory
+        they all can reach (a local disk or a network share).
+
+        Shard n reads its batches from spool/shard-n; a batch is written to
+        a temporary file first and renamed into the inbox, so readers never
+        see half a batch, and only removed once its urls are stored. Every
+        shard also publishes its status as spool/status-n.json. '''
+
+    def __init__(self, directory, shard_id, shard_count):
+        self.directory = directory
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.sequence = itertools.count()
+        self.tmp = os.path.join(directory, "tmp")
+        for path in [self.tmp] + [self._inbox(shard) for shard in range(shard_count)]:
+            os.makedirs(path, exist_ok=True)
+
+    def _inbox(self, shard):
+        return os.path.join(self.directory, f"shard-{shard}")
+
+    def _write(self, path, data):
+        tmp_path = os.path.join(self.tmp, f"{self.shard_id}-{os.path.basename(path)}")
+        with open(tmp_path, "w") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def reset(self):
+        # Drops everything addressed to this shard, for --restart
+        inbox = self._inbox(self.shard_id)
+        for name in os.listdir(inbox):
+            os.remove(os.path.join(inbox, name))
+        status = os.path.join(self.directory, f"status-{self.shard_id}.json")
+        if os.path.exists(status):
+            os.remove(status)
+
+    def send(self, shard, urls):
+        name = f"{time.time():.6f}-{self.shard_id}-{next(self.sequence)}.urls"
+        self._write(os.path.join(self._inbox(shard), name), "\n".join(urls))
+
+    def receive(self):
+        ''' The batches sent to this shard, oldest first, as (key, urls).
+            They stay in the inbox until they are removed. '''
+        inbox = self._inbox(self.shard_id)
+        batches = []
+        for name in sorted(os.listdir(inbox)):
+            try:
+                with open(os.path.join(inbox, name)) as file:
+                    urls = file.read().split("\n")
+            except FileNotFoundError:
+                continue
+            batches.append((name, [url for url in urls if url]))
+        return batches
+
+    def remove(self, keys):
+        inbox = self._inbox(self.shard_id)
+        for name in keys:
+            try:
+                os.remove(os.path.join(inbox, name))
+            except FileNotFoundError:
+                pass
+
+    def pending(self):
+        ''' Whether a batch waits in the inbox of any shard. '''
+        return any(os.listdir(self._inbox(shard)) for shard in range(self.shard_count))
+
+    def publish(self, status):
+        self._write(
+            os.path.join(self.directory, f"status-{self.shard_id}.json"),
+            json.dumps(status))
+
+    def statuses(self):
+        ''' Status of every shard, None for shards that have not published
+            one yet. '''
+        statuses = []
+        for shard in range(self.shard_count):
+            try:
+                with open(os.path.join(self.directory, f"status-{shard}.json")) as file:
+                    statuses.append(json.load(file))
+            except (OSError, ValueError):
+                statuses.append(None)
+        return statuses
+
+
+class DataframeTransport(object):
+    ''' The same as SpoolTransport through a spacetime dataframe, for
+        shards on machines without a shared directory. The dataframe is
+        hosted by any spacetime node serving the UrlBatch and ShardStatus
+        types, e.g. python -m crawler.shard --serve PORT. Calls are
+        serialized. '''
+
+    def __init__(self, address, shard_id, shard_count):
+        from spacetime import Dataframe
+        from utils.pcc_models import UrlBatch, ShardStatus
+        self.UrlBatch, self.ShardStatus = UrlBatch, ShardStatus
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.sequence = itertools.count()
+        self.lock = Lock()
+        self.df = Dataframe(
+            f"crawler-shard-{shard_id}", {UrlBatch, ShardStatus}, details=address)
+
+    def reset(self):
+        with self.lock:
+            self.df.pull()
+            for batch in self.df.read_all(self.UrlBatch):
+                if batch.shard == self.shard_id:
+                    self.df.delete_one(self.UrlBatch, batch)
+            self.df.commit()
+            self.df.push()
+
+    def send(self, shard, urls):
+        batch_id = f"{time.time():.6f}-{self.shard_id}-{next(self.sequence)}"
+        with self.lock:
+            self.df.add_one(self.UrlBatch, self.UrlBatch(batch_id, shard, tuple(urls)))
+            self.df.commit()
+            self.df.push()
+
+    def receive(self):
+        with self.lock:
+            self.df.pull()
+            batches = sorted(
+                (batch for batch in self.df.read_all(self.UrlBatch)
+                 if batch.shard == self.shard_id),
+                key=lambda batch: batch.batch_id)
+            return [(batch.batch_id, list(batch.urls)) for batch in batches]
+
+    def remove(self, keys):
+        if not keys:
+            return
+        with self.lock:
+            for key in keys:
+                batch = self.df.read_one(self.UrlBatch, key)
+                if batch is not None:
+                    self.df.delete_one(self.UrlBatch, batch)
+            self.df.commit()
+            self.df.push()
+
+    def pending(self):
+        with self.lock:
+            self.df.pull()
+            return bool(self.df.read_all(self.UrlBatch))
+
+    def publish(self, status):
+        key = str(self.shard_id)
+        with self.lock:
+            record = self.df.read_one(self.ShardStatus, key)
+            if record is None:
+                record = self.ShardStatus(key)
+                self.df.add_one(self.ShardStatus, record)
+            record.idle = status["idle"]
+            record.run = status["run"]
+            record.batches = status["batches"]
+            self.df.commit()
+            self.df.push()
+
+    def statuses(self):
+        with self.lock:
+            self.df.pull()
+            records = {
+                record.shard_key: record for record in self.df.read_all(self.ShardStatus)}
+        statuses = []
+        for shard in range(self.shard_count):
+            record = records.get(str(shard))
+            statuses.append(None if record is None else {
+                "idle": record.idle, "run": record.run, "batches": record.batches})
+        return statuses
+
+
+class ShardRouter(object):
+    ''' Sends the urls of hosts owned by other shards there in batches and
+        hands the urls other shards send here to add_url.
+
+        A batch goes out once it holds SHARD_BATCH urls or every
+        SHARD_INTERVAL seconds. A shard flushes its outboxes before it
+        reports itself idle, and reports itself busy, with one more batch
+        received, before it removes a batch it stored from its inbox. So
+        while urls are on their way some batch waits in an inbox or some
+        shard is busy or has a new status, and the crawl is over when every
+        shard is idle and no batch waits, twice in a row with the same
+        statuses. Statuses carry the id of the shard's run rather than
+        counters that would have to survive a restart, and batches of a
+        shard that stopped halfway are received again when it resumes. '''
+
+    def __init__(self, config, transport):
+        self.logger = get_logger(f"SHARD-{config.shard_id}", "FRONTIER")
+        self.shard_id = config.shard_id
+        self.ring = HashRing(config.shard_count)
+        self.transport = transport
+        self.batch_size = config.shard_batch
+        self.interval = config.shard_interval
+        self.lock = Lock()
+        self.outboxes = {shard: [] for shard in range(config.shard_count)}
+        self.run = uuid.uuid4().hex
+        # Batches received by this run
+        self.batches = 0
+        self.last_statuses = None
+
+    def owns(self, url):
+        return self.ring.owner(urlparse(url).netloc) == self.shard_id
+
+    def forward(self, url):
+        shard = self.ring.owner(urlparse(url).netloc)
+        with self.lock:
+            outbox = self.outboxes[shard]
+            outbox.append(url)
+            if len(outbox) >= self.batch_size:
+                self._send(shard)
+
+    def _send(self, shard):
+        urls = self.outboxes[shard]
+        if urls:
+            self.outboxes[shard] = []
+            self.transport.send(shard, urls)
+            metrics.inc("shard_urls_sent", len(urls))
+
+    def flush(self):
+        with self.lock:
+            for shard in self.outboxes:
+                self._send(shard)
+
+    def receive(self, add_url, store):
+        ''' Hands the urls sent here to add_url, and removes their batches
+            once store() has written them to disk. '''
+        batches = self.transport.receive()
+        if not batches:
+            return
+        for _, urls in batches:
+            for url in urls:
+                add_url(url)
+            metrics.inc("shard_urls_received", len(urls))
+        store()
+        with self.lock:
+            self.batches += len(batches)
+        self.publish(False)
+        self.transport.remove([key for key, _ in batches])
+
+    def publish(self, idle):
+        with self.lock:
+            status = {"idle": idle, "run": self.run, "batches": self.batches}
+        self.transport.publish(status)
+
+    def finished(self):
+        ''' Called while this shard is idle. '''
+        self.flush()
+        self.publish(True)
+        # Statuses first: a batch removed after they were read was
+        # announced by a status that differs from them
+        statuses = self.transport.statuses()
+        if (any(status is None or not status["idle"] for status in statuses)
+                or self.transport.pending()):
+            self.last_statuses = None
+            return False
+        if statuses != self.last_statuses:
+            # Check again once more, in case a batch was just being taken
+            self.last_statuses = statuses
+            return False
+        return True
+
+
+def make_transport(config):
+    ''' Transport for SHARD_TRANSPORT in config.ini: spool or dataframe. '''
+    if config.shard_transport == "dataframe":
+        host, port = config.shard_address.rsplit(":", 1)
+        return DataframeTransport((host, int(port)), config.shard_id, config.shard_count)
+    return SpoolTransport(config.shard_address, config.shard_id, config.shard_count)
+
+
+class ShardedFrontier(Frontier):
+    ''' Frontier of one shard of a crawl split over SHARD_COUNT crawlers.
+        Only urls of hosts owned by this shard are stored and downloaded,
+        all others are forwarded to their owner. '''
+    # Seconds between checks whether the other shards are done, while idle
+    idle_wait = 1.0
+
+    def __init__(self, config, restart):
+        transport = make_transport(config)
+        if restart:
+            transport.reset()
+        self.router = ShardRouter(config, transport)
+        super().__init__(config, restart)
+        self.router.publish(False)
+        Thread(target=self._exchange, daemon=True).start()
+
+    def _exchange(self):
+        # The only thread that receives, so it never waits on the frontier
+        # lock while holding anything the frontier needs.
+        while True:
+            time.sleep(self.router.interval)
+            try:
+                self.router.flush()
+                self.router.receive(self.add_url, self.save.flush)
+                self.router.publish(
+                    not (self.tbd_count or self.waiting or self.in_flight))
+            except Exception:
+                self.logger.exception("Failed to exchange urls with other shards.")
+
+    def add_url(self, url):
+        if not self.router.owns(url):
+            self.router.forward(normalize(url))
+            return
+        super().add_url(url)
+
+    def _finished(self):
+        if self.waiting:
+            return False
+        return self.router.finished()
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument("--serve", type=int, required=True, help="port to host the shard dataframe on")
+    args = parser.parse_args()
+    from spacetime import Dataframe
+    from utils.pcc_models import UrlBatch, ShardStatus
+    dataframe = Dataframe("crawler-shards", {UrlBatch, ShardStatus}, server_port=args.serve)
+    print(f"Serving the shard dataframe on port {args.serve}.")
+    while True:
+        time.sleep(3600)
@@ -0,0 +1,349 @@
+import os
+import time
+import atexit
+import sqlite3
+
+from threading import Thread, RLock, Event
+
+from utils import get_logger
+
+# PRAGMA synchronous levels that can be chosen with SAVE_SYNC in config.ini.
+#   OFF    -> never fsync, fastest, a power loss can lose recent batches.
+#   NORMAL -> fsync at WAL checkpoints, a crash only loses unflushed batches.
+#   FULL   -> fsync every committed batch.
+SYNC_MODES = {"OFF", "NORMAL", "FULL"}
+
+
+class FrontierStore(object):
+    ''' Write-behind persistence for the frontier save file.
+
+        Writes are buffered in memory and committed to a SQLite database in
+        WAL mode in one transaction once SAVE_BATCH writes are pending or
+        SAVE_INTERVAL seconds have passed. Reads see buffered writes, so the
+        store behaves like the shelve it replaces.
+
+        Incomplete urls also have the score the frontier ordered them by and
+        whether they are queued in the frontier's memory, so the frontier
+        can keep only a window of them in memory and take() the best ones
+        that wait on disk when it runs low.
+
+        The last download of every url is kept in a second table, visits:
+        its ETag and Last-Modified validators, content hash and when it is
+        due to be visited again, for refreshing a finished crawl. A third
+        table, pages, keeps what the scraper counted for each url, so a
+        page that changed can be taken out of the statistics again.
+
+        before_flush is called ahead of every commit, for whatever has to
+        be on disk before the urls of a batch are completed. '''
+
+    def __init__(self, path, batch_size=500, flush_interval=5.0,
+                 sync_mode="NORMAL", before_flush=None):
+        self.logger = get_logger("STORE", "FRONTIER")
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        sync_mode = sync_mode.upper()
+        assert sync_mode in SYNC_MODES, f"SAVE_SYNC must be one of {SYNC_MODES}"
+        self.lock = RLock()
+        # urlhash -> (url, completed, score, queued) writes not yet committed.
+        self.pending = dict()
+        # urlhash -> visit row not yet committed.
+        self.pending_visits = dict()
+        # urlhash -> counted page (bytes) not yet committed, None deletes it.
+        self.pending_pages = dict()
+        self.last_flush = time.monotonic()
+        self.before_flush = before_flush
+
+        self.db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(f"PRAGMA synchronous={sync_mode}")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, "
+            "completed INTEGER NOT NULL DEFAULT 0)")
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(urls)")}
+        # Save files written before urls could wait on disk
+        if "score" not in columns:
+            self.db.execute("ALTER TABLE urls ADD COLUMN score REAL NOT NULL DEFAULT 0")
+        if "queued" not in columns:
+            self.db.execute("ALTER TABLE urls ADD COLUMN queued INTEGER NOT NULL DEFAULT 0")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS waiting ON urls (score) "
+            "WHERE completed = 0 AND queued = 0")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS visits ("
+            "urlhash TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, "
+            "content_hash TEXT, visited REAL NOT NULL, interval REAL NOT NULL, "
+            "next_visit REAL NOT NULL)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "urlhash TEXT PRIMARY KEY, page BLOB NOT NULL)")
+        self.count = self.db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+
+        # Background flusher so buffered writes reach disk while idle.
+        self.closed = Event()
+        if self.flush_interval > 0:
+            self.flusher = Thread(target=self._flush_loop, daemon=True)
+            self.flusher.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def remove(path):
+        # Delete the database along with its WAL side files.
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    def _flush_loop(self):
+        while not self.closed.wait(self.flush_interval):
+            if time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+
+    def _maybe_flush(self):
+        if (len(self.pending) + len(self.pending_visits) + len(self.pending_pages)
+                >= self.batch_size
+                or time.monotonic() - self.last_flush >= self.flush_interval):
+            self.flush()
+
+    def _row(self, urlhash):
+        return self.db.execute(
+            "SELECT url, completed FROM urls WHERE urlhash = ?",
+            (urlhash,)).fetchone()
+
+    def __contains__(self, urlhash):
+        with self.lock:
+            return urlhash in self.pending or self._row(urlhash) is not None
+
+    def __getitem__(self, urlhash):
+        with self.lock:
+            if urlhash in self.pending:
+                return self.pending[urlhash][:2]
+            row = self._row(urlhash)
+        if row is None:
+            raise KeyError(urlhash)
+        return row[0], bool(row[1])
+
+    def __setitem__(self, urlhash, value):
+        url, completed = value
+        with self.lock:
+            if urlhash not in self.pending and self._row(urlhash) is None:
+                self.count += 1
+            self.pending[urlhash] = (url, completed, 0.0, False)
+            self._maybe_flush()
+
+    def insert(self, urlhash, url, completed=False, score=0.0, queued=True):
+        ''' Like store[urlhash] = (url, completed) for a urlhash the caller
+            knows is new, which skips the lookup. An incomplete url that is
+            not queued waits on disk for take(). '''
+        with self.lock:
+            self.count += 1
+            self.pending[urlhash] = (url, completed, score, queued)
+            self._maybe_flush()
+
+    def __len__(self):
+        return self.count
+
+    def values(self):
+        self.flush()
+        for url, completed in self.db.execute(
+                "SELECT url, completed FROM urls"):
+            yield url, bool(completed)
+
+    def urls(self):
+        ''' Yields every url in the store. '''
+        self.flush()
+        for (url,) in self.db.execute("SELECT url FROM urls"):
+            yield url
+
+    def incomplete(self):
+        ''' Yields the urls that still have to be downloaded. '''
+        self.flush()
+        for (url,) in self.db.execute(
+                "SELECT url FROM urls WHERE completed = 0"):
+            yield url
+
+    def waiting(self):
+        ''' Number of incomplete urls that are not queued. '''
+        self.flush()
+        return self.db.execute(
+            "SELECT COUNT(*) FROM urls WHERE completed = 0 AND queued = 0").fetchone()[0]
+
+    def take(self, limit):
+        ''' Marks the limit best scored waiting urls queued and returns them
+            as (url, score). '''
+        with self.lock:
+            self.flush()
+            rows = self.db.execute(
+                "SELECT urlhash, url, score FROM urls "
+                "WHERE completed = 0 AND queued = 0 ORDER BY score LIMIT ?",
+                (limit,)).fetchall()
+            # One transaction, or every row is committed on its own
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(
+                    "UPDATE urls SET queued = 1 WHERE urlhash = ?",
+                    [(urlhash,) for urlhash, _, _ in rows])
+                self.db.execute("COMMIT")
+            except sqlite3.Error:
+                self.db.execute("ROLLBACK")
+                self.logger.exception(
+                    f"Failed to take {len(rows)} urls from {self.path}.")
+                raise
+        return [(url, score) for _, url, score in rows]
+
+    def reset_queued(self):
+        ''' Puts every incomplete url back on disk, for a frontier that
+            starts with an empty memory. '''
+        with self.lock:
+            self.flush()
+            self.db.execute(
+                "UPDATE urls SET queued = 0 WHERE queued = 1 AND completed = 0")
+
+    def last_rowid(self):
+        ''' Rowid of the newest url; rows written later have larger ones. '''
+        self.flush()
+        return self.db.execute("SELECT MAX(rowid) FROM urls").fetchone()[0] or 0
+
+    def urls_since(self, rowid):
+        ''' Yields the urls written after the row with the given rowid. '''
+        self.flush()
+        for (url,) in self.db.execute(
+                "SELECT url FROM urls WHERE rowid > ?", (rowid,)):
+            yield url
+
+    def rewrite_urls(self, rewrite, version):
+        ''' Rewrites every url of a save file older than version, as
+            rewrite(url) -> (urlhash, url), and marks it as version. Urls
+            that end up the same are merged, completed if either was.
+            Returns the number of urls that changed. '''
+        with self.lock:
+            self.flush()
+            if self.db.execute("PRAGMA user_version").fetchone()[0] >= version:
+                return 0
+            rows = self.db.execute(
+                "SELECT urlhash, url, completed, score, queued FROM urls").fetchall()
+            changed = 0
+            self.db.execute("BEGIN")
+            try:
+                for urlhash, url, completed, score, queued in rows:
+                    new_hash, new_url = rewrite(url)
+                    if new_hash == urlhash and new_url == url:
+                        continue
+                    changed += 1
+                    self.db.execute("DELETE FROM urls WHERE urlhash = ?", (urlhash,))
+                    self.db.execute(
+                        "INSERT OR IGNORE INTO urls "
+                        "(urlhash, url, completed, score, queued) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (new_hash, new_url, completed, score, queued))
+                    if completed:
+                        self.db.execute(
+                            "UPDATE urls SET completed = 1 WHERE urlhash = ?", (new_hash,))
+                    # The visit and page of a merged url are those it already had
+                    for table in ("visits", "pages"):
+                        self.db.execute(
+                            f"UPDATE OR IGNORE {table} SET urlhash = ? WHERE urlhash = ?",
+                            (new_hash, urlhash))
+                        self.db.execute(f"DELETE FROM {table} WHERE urlhash = ?", (urlhash,))
+                self.db.execute(f"PRAGMA user_version = {int(version)}")
+                self.db.execute("COMMIT")
+            except sqlite3.Error:
+                self.db.execute("ROLLBACK")
+                self.logger.exception(f"Failed to rewrite the urls of {self.path}.")
+                raise
+            self.count = self.db.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+            return changed
+
+    def visit(self, urlhash):
+        ''' The last visit of the url as (etag, last_modified, content_hash,
+            visited, interval, next_visit), or None. '''
+        with self.lock:
+            if urlhash in self.pending_visits:
+                return self.pending_visits[urlhash]
+            return self.db.execute(
+                "SELECT etag, last_modified, content_hash, visited, interval, "
+                "next_visit FROM visits WHERE urlhash = ?", (urlhash,)).fetchone()
+
+    def record_visit(self, urlhash, visit):
+        with self.lock:
+            self.pending_visits[urlhash] = tuple(visit)
+            self._maybe_flush()
+
+    def page(self, urlhash):
+        ''' What record_page() stored for the url last, or None. '''
+        with self.lock:
+            if urlhash in self.pending_pages:
+                return self.pending_pages[urlhash]
+            row = self.db.execute(
+                "SELECT page FROM pages WHERE urlhash = ?", (urlhash,)).fetchone()
+        return row[0] if row is not None else None
+
+    def record_page(self, urlhash, page):
+        with self.lock:
+            self.pending_pages[urlhash] = page
+            self._maybe_flush()
+
+    def reschedule(self, now):
+        ''' Marks every completed url that is due for a visit at time now,
+            or was never visited, incomplete again so it waits on disk.
+            Returns how many there were. '''
+        with self.lock:
+            self.flush()
+            return self.db.execute(
+                "UPDATE urls SET completed = 0, queued = 0 WHERE completed = 1 "
+                "AND NOT EXISTS (SELECT 1 FROM visits "
+                "WHERE visits.urlhash = urls.urlhash AND next_visit > ?)",
+                (now,)).rowcount
+
+    def flush(self):
+        ''' Commits all buffered writes in a single transaction. '''
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.pending and not self.pending_visits and not self.pending_pages:
+                return
+            if self.before_flush is not None:
+                self.before_flush()
+            rows = [
+                (urlhash, url, int(completed), score, int(queued))
+                for urlhash, (url, completed, score, queued) in self.pending.items()]
+            visits = [
+                (urlhash,) + visit for urlhash, visit in self.pending_visits.items()]
+            pages = [
+                (urlhash, page) for urlhash, page in self.pending_pages.items()
+                if page is not None]
+            removed = [
+                (urlhash,) for urlhash, page in self.pending_pages.items() if page is None]
+            self.db.execute("BEGIN")
+            try:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO urls "
+                    "(urlhash, url, completed, score, queued) "
+                    "VALUES (?, ?, ?, ?, ?)", rows)
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO visits "
+                    "(urlhash, etag, last_modified, content_hash, visited, "
+                    "interval, next_visit) VALUES (?, ?, ?, ?, ?, ?, ?)", visits)
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO pages (urlhash, page) VALUES (?, ?)", pages)
+                self.db.executemany("DELETE FROM pages WHERE urlhash = ?", removed)
+                self.db.execute("COMMIT")
+            except sqlite3.Error:
+                self.db.execute("ROLLBACK")
+                self.logger.exception(
+                    f"Failed to flush {len(rows)} urls to {self.path}.")
+                raise
+            self.pending.clear()
+            self.pending_visits.clear()
+            self.pending_pages.clear()
+
+    # shelve compatibility for code written against the old save file.
+    sync = flush
+
+    def close(self):
+        with self.lock:
+            if self.closed.is_set():
+                return
+            self.flush()
+            self.closed.set()
+            self.db.close()
@@ -3,6 +3,9 @@ from threading import Thread
 from inspect import getsource
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
+from utils import robots, archive
+from crawler import pipeline
 import scraper
 import time
 
@@ -18,34 +21,126 @@ class Worker(Thread):
         super().__init__(daemon=True)
         
     def run(self):
+        failures = 0
         while True:
-            tbd_url = self.frontier.get_tbd_url()
+            with metrics.timer("frontier_pop"):
+                tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
-                scraper.record_data()
                 with open("Finished.txt", "a") as file:
                     file.write("Frontier is empty, stopped")
 
                 break
+            if robots.cache is not None:
+                with metrics.timer("robots"):
+                    allowed, fetched = robots.cache.allowed(tbd_url)
+                if not allowed and robots.cache.unreachable(tbd_url):
+                    # Nothing is allowed until robots.txt can be fetched,
+                    # try the url again once it is fetched again
+                    metrics.inc("robots_unreachable")
+                    self.logger.info(f"Deferring {tbd_url}, robots.txt could not be fetched.")
+                    self.frontier.defer_url(tbd_url, robots.cache.expires_in(tbd_url))
+                    continue
+                if not allowed:
+                    metrics.inc("robots_disallowed")
+                    self.logger.info(f"Skipping {tbd_url}, disallowed by robots.txt.")
+                    self.frontier.mark_url_complete(tbd_url)
+                    continue
+                if fetched:
+                    # robots.txt was a request to the same host
+                    time.sleep(self.config.time_delay)
+            observe = getattr(self.frontier, "observe", None)
+            started = time.perf_counter()
             try:
-                resp = download(tbd_url, self.config, self.logger)
-            except:
-                # Wait 10 seconds if server is down
-                with open("Finished.txt", "a") as file:
-                    file.write("Trying to reconnect")
-                break
-                time.sleep(10)
+                with metrics.timer("download"):
+                    resp = download(tbd_url, self.config, self.logger)
+                failures = 0
+            except Exception as e:
+                if observe is not None:
+                    observe(tbd_url, None, time.perf_counter() - started)
+                # The download already retried with backoff, so the cache
+                # server is struggling. Hand the url back and wait longer
+                # after every consecutive failure before giving up.
+                failures += 1
+                metrics.inc("download_failures")
+                self.logger.error(
+                    f"Failed to download {tbd_url} ({failures} in a row): {e}")
+                self.frontier.release_url(tbd_url)
+                if failures >= self.config.max_failures:
+                    with open("Finished.txt", "a") as file:
+                        file.write("Cache server unreachable, stopped")
+                    break
+                time.sleep(min(60, self.config.download_backoff * 2 ** failures))
+                continue
+
+            # Only the cache server's own status tells about its load, the
+            # origin's status (resp.status) is part of the page
+            cache_status = resp.cache_status if resp is not None else None
+            if observe is not None:
+                observe(tbd_url, cache_status, time.perf_counter() - started)
+            if cache_status is not None and (cache_status == 429 or 500 <= cache_status < 600):
+                # The cache server is overloaded, try the url again once the
+                # host's delay, just backed off, has passed. Not the url's
+                # fault, so it does not count as an attempt.
+                metrics.inc("download_overloaded")
+                self.frontier.defer_url(tbd_url, 0)
                 continue
-    
-            
+
             # Only continue if it didn't except ?
             if resp != None:
+                metrics.inc("pages_downloaded")
                 self.logger.info(
                 f"Downloaded {tbd_url}, status <{resp.status}>, "
                 f"using cache {self.config.cache_server}.")
 
-                scraped_urls = scraper.scraper(tbd_url, resp)
-                for scraped_url in scraped_urls:
-                    self.frontier.add_url(scraped_url)
+                visit = changed = None
+                check_visit = getattr(self.frontier, "check_visit", None)
+                if check_visit is not None:
+                    visit, changed = check_visit(tbd_url, resp)
+                if self.config.refresh and visit is not None and not changed:
+                    # Same page as on the last visit, which was only
+                    # recorded after its links were stored
+                    metrics.inc("pages_unchanged")
+                    self.frontier.record_visit(tbd_url, visit)
+                    self.frontier.mark_url_complete(tbd_url)
+                    continue
+
+                if archive.current is not None and resp.status == 200 and resp.content is not None:
+                    with metrics.timer("archive"):
+                        archive.current.put(tbd_url, resp)
+
+                analysis = None
+                # status first: other responses are never decoded
+                if resp.status == 200 and resp.content is not None:
+                    # Parse off the GIL when the analysis pool is running
+                    try:
+                        with metrics.timer("parse"):
+                            analysis = pipeline.analyze(
+                                resp.url.split("#")[0], resp.content,
+                                self.config.parser_backend)
+                    except Exception:
+                        self.logger.exception(f"Failed to analyze {tbd_url}.")
+                # A refreshed page replaces what was counted for it before
+                previous = None
+                if self.config.refresh and visit is not None:
+                    previous = self.frontier.counted_page(tbd_url)
+                scraped_urls, repeated_urls, page = scraper.scrape(
+                    tbd_url, resp, analysis, previous)
+                with metrics.timer("frontier_add"):
+                    for scraped_url in scraped_urls:
+                        self.frontier.add_url(scraped_url)
+                    # Links to urls seen before can still raise their priority
+                    linked = getattr(self.frontier, "linked", None)
+                    if linked is not None and repeated_urls:
+                        linked(repeated_urls)
+                add_redirect = getattr(self.frontier, "add_redirect", None)
+                if add_redirect is not None and resp.url and resp.url != tbd_url:
+                    # The scraper marked the url redirected to as visited
+                    add_redirect(resp.url)
+                if visit is not None:
+                    self.frontier.record_page(tbd_url, page)
+                    self.frontier.record_visit(tbd_url, visit)
+                # Politeness is enforced per host by the frontier.
                 self.frontier.mark_url_complete(tbd_url)
-                time.sleep(self.config.time_delay)
+            else:
+                self.frontier.release_url(tbd_url)
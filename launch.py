@@ -1,16 +1,44 @@
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
-from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
+from crawler.replay import replay as replay_archive
+import scraper
 
 
-def main(config_file, restart):
+def main(config_file, restart, report, cache_server=None, replay=False, shard=None,
+         refresh=False):
     cparser = ConfigParser()
     cparser.read(config_file)
+    if shard:
+        # --shard ID/COUNT overrides the SHARDING section
+        shard_id, shard_count = shard.split("/")
+        if not cparser.has_section("SHARDING"):
+            cparser.add_section("SHARDING")
+        cparser["SHARDING"]["SHARD_ID"] = shard_id
+        cparser["SHARDING"]["SHARD_COUNT"] = shard_count
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
+    config.refresh = refresh and not restart
+    if report:
+        # Write the reports from the checkpointed statistics and stop
+        scraper.configure(config)
+        scraper.record_data()
+        return
+    if replay:
+        # Analyze the archived pages again instead of crawling
+        assert config.archive, "Set ARCHIVE in config.ini to replay"
+        replay_archive(config)
+        return
+    if cache_server:
+        # Skip registration and use the given cache server, e.g. the local
+        # simulator in bench/cache_server.py
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        # Imported here so spacetime is only needed to register
+        from utils.server_registration import get_cache_server
+        config.cache_server = get_cache_server(config, restart)
     crawler = Crawler(config, restart)
     crawler.start()
 
@@ -19,5 +47,11 @@ if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--report", action="store_true", default=False)
+    parser.add_argument("--cache_server", type=str, default=None)
+    parser.add_argument("--replay", action="store_true", default=False)
+    parser.add_argument("--shard", type=str, default=None, help="ID/COUNT, e.g. 0/4")
+    parser.add_argument("--refresh", action="store_true", default=False)
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    main(args.config_file, args.restart, args.report, args.cache_server, args.replay,
+         args.shard, args.refresh)
@@ -1,33 +1,230 @@
-import re
-from urllib.parse import urlparse, urljoin, urlunparse
-from bs4 import BeautifulSoup
+from urllib.parse import urlparse, urlunparse
 import hashlib
-
-# Set of unique pages
+import sys
+from threading import Lock, RLock
+
+from utils import normalize as frontier_normalize
+from utils.bloom import ScalableBloomFilter, key64
+from utils.canonical import canonical_key
+from utils.page_analysis import analyze_page
+from utils.traps import TrapDetector
+from utils.budget import BudgetIndex
+from utils.simhash import simhash, SimHashIndex
+from utils.checkpoint import Checkpoint
+from utils.topk import make_counter
+from utils.metrics import metrics
+from utils.url_filter import UrlFilter
+from utils.stats import ThreadStats, SortedCounts
+from utils.report import write_reports
+from utils import robots
+
+# Set of unique pages, as 64 bit keys of their canonical urls
 unique_pages = set()
+# Whether unique_pages may also have keys of urls as they were visited, from
+# a checkpoint written before canonical_key()
+legacy_unique_pages = False
 # List containing url at index 0, count at index 1
 longest_page_words = ['page_url', 0]
-# Dictionary containing [word] = # of occurrences
-word_frequency = {}
-# Dictionary containing [subdomain] = # of occurrences
-subdomains = {}
-
-# Set of all visited urls
-visited_urls = set()
-# Used to index the previous few links to detect traps
-previous_links = []
-# Depth
-depth_dict = {}
-# Set of hashes of previous pages
+# Counter of [word] = # of occurrences that keeps its top words up to date
+word_frequency = make_counter()
+# Number of words written to TopWords.txt
+top_words = 50
+# Dictionary containing [subdomain] = # of occurrences, kept in sorted order
+subdomains = SortedCounts()
+
+# Bloom filter of all visited and discovered urls (in the form the frontier
+# stores them), shared with the frontier
+visited_urls = ScalableBloomFilter()
+# Static rules of is_valid (schemes, domains, extensions), set from config.ini
+url_filter = UrlFilter()
+# Detects traps by counting the urls generated from each url template
+trap_detector = TrapDetector()
+# Pages fetched, new content and duplicates per host and directory, to
+# throttle and prune directories that stopped yielding new pages
+budget = BudgetIndex()
+# Set of hashes of previous pages, as 64 bit prefixes of their sha256
 previous_hashes = set()
-# Normalized paths
-normalized_paths = set()
+# Bloom filter of normalized paths
+normalized_paths = ScalableBloomFilter()
+# SimHash fingerprints of previous pages, None if near duplicate detection is off
+near_duplicates = SimHashIndex(3)
 
 count = 0
 
-def normalize(url):
+# Every thread counts pages into its own accumulator. count, longest_page_words,
+# word_frequency and subdomains above are the merged view of them, brought up
+# to date by merge_stats() every merge_pages pages and before they are read.
+page_stats = ThreadStats()
+merge_lock = RLock()
+merge_pages = 100
+
+# Checkpoint of the state above next to the frontier save file, None if off
+checkpoint = None
+# Pages counted since the last checkpoint delta, replayed by count_page()
+pending_pages = []
+checkpoint_lock = Lock()
+checkpoint_pages = 100
+checkpoint_snapshot = 20
+
+# Parser used for page analysis, set from config.ini by configure()
+parser_backend = "html.parser"
+
+ENGLISH_STOPWORDS = {'a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an', 
+'and', 'any', 'are', "aren't", 'as', 'at', 'be', 'because', 'been', 'before', 'being', 'below', 
+'between', 'both', 'but', 'by', "can't", 'cannot', 'could', "couldn't", 'did', "didn't", 'do', 'does', 
+"doesn't", 'doing', "don't", 'down', 'during', 'each', 'few', 'for', 'from', 'further', 'had', "hadn't", 
+'has', "hasn't", 'have', "haven't", 'having', 'he', "he'd", "he'll", "he's", 'her', 'here', "here's", 'hers', 
+'herself', 'him', 'himself', 'his', 'how', "how's", 'i', "i'd", "i'll", "i'm", "i've", 'if', 'in', 'into', 'is', 
+"isn't", 'it', "it's", 'its', 'itself', "let's", 'me', 'more', 'most', "mustn't", 'my', 'myself', 'no', 'nor', 
+'not', 'of', 'off', 'on', 'once', 'only', 'or', 'other', 'ought', 'our', 'ours', '', '', '', 'ourselves', 'out', 
+'over', 'own', 'same', "shan't", 'she', "she'd", "she'll", "she's", 'should', "shouldn't", 'so', 'some', 'such', 
+'than', 'that', "that's", 'the', 'their', 'theirs', 'them', 'themselves', 'then', 'there', "there's", 'these', 
+'they', "they'd", "they'll", "they're", "they've", 'this', 'those', 'through', 'to', 'too', 'under', 'until', 
+'up', 'very', 'was', "wasn't", 'we', "we'd", "we'll", "we're", "we've", 'were', "weren't", 'what', "what's", 
+'when', "when's", 'where', "where's", 'which', 'while', 'who', "who's", 'whom', 'why', "why's", 'with', "won't", 'would', 
+"wouldn't", 'you', "you'd", "you'll", "you're", "you've", 'your', 'yours', 'yourself', 'yourselves'}
+
+def configure(config, restart=False, checkpoints=True):
+    # Apply crawler settings from config.ini to the scraper and resume the
+    # statistics from the checkpoint unless restarting. Without checkpoints
+    # the checkpoint file is neither read, removed nor written.
+    global parser_backend
+    global checkpoint
+    global checkpoint_pages
+    global checkpoint_snapshot
+    global word_frequency
+    global top_words
+    global url_filter
+    global trap_detector
+    global near_duplicates
+    global visited_urls
+    global normalized_paths
+    global unique_pages
+    global legacy_unique_pages
+    global longest_page_words
+    global subdomains
+    global previous_hashes
+    global budget
+    global count
+    global page_stats
+    # Start from empty statistics, the checkpoint below restores them
+    page_stats = ThreadStats()
+    unique_pages = set()
+    legacy_unique_pages = False
+    longest_page_words = ['page_url', 0]
+    subdomains = SortedCounts()
+    previous_hashes = set()
+    budget = BudgetIndex(
+        config.budget_min_pages, config.budget_min_yield, config.budget_throttle_yield)
+    count = 0
+    pending_pages.clear()
+    parser_backend = config.parser_backend
+    url_filter = UrlFilter(config.filter_domains, config.filter_extensions, config.filter_blocked)
+    top_words = config.top_words
+    word_frequency = make_counter(config.word_count_mode, config.word_count_capacity, top_words)
+    visited_urls = ScalableBloomFilter(config.seen_capacity, config.seen_error_rate)
+    normalized_paths = ScalableBloomFilter(config.seen_capacity, config.seen_error_rate)
+    near_duplicates = (
+        SimHashIndex(config.near_duplicate_distance)
+        if config.near_duplicate_distance >= 0 else None)
+    trap_detector = TrapDetector(
+        config.trap_template_limit, config.trap_half_life)
+
+    checkpoint_pages = config.checkpoint_pages
+    checkpoint_snapshot = config.checkpoint_snapshot
+    checkpoint = (
+        Checkpoint(config.save_file + ".state")
+        if checkpoints and checkpoint_pages > 0 else None)
+    if checkpoint is not None:
+        if restart:
+            checkpoint.remove()
+        elif checkpoint.exists():
+            load_checkpoint()
+
+def snapshot_state():
+    # Copy of everything needed to resume the statistics
+    merge_stats()
+    return {
+        "count": count,
+        "unique_pages": set(unique_pages),
+        "canonical_keys": not legacy_unique_pages,
+        "longest_page_words": list(longest_page_words),
+        "word_frequency": word_frequency.copy(),
+        "subdomains": dict(subdomains),
+        "previous_hashes": set(previous_hashes),
+        "near_duplicates": list(near_duplicates) if near_duplicates is not None else [],
+        "budget": budget.get_state(),
+        "traps": trap_detector.get_state(),
+    }
+
+def load_checkpoint():
+    # Restore the last snapshot and replay the pages counted after it
+    global count
+    global unique_pages
+    global legacy_unique_pages
+    global longest_page_words
+    global word_frequency
+    global subdomains
+    global previous_hashes
+
+    snapshot, deltas = checkpoint.load()
+    if snapshot is not None:
+        count = snapshot["count"]
+        # Older checkpoints have urls, or keys of the urls as visited
+        unique_pages = {
+            canonical_key(page) if isinstance(page, str) else page
+            for page in snapshot["unique_pages"]}
+        legacy_unique_pages = not snapshot.get("canonical_keys", False) and any(
+            isinstance(page, int) for page in snapshot["unique_pages"])
+        longest_page_words = snapshot["longest_page_words"]
+        word_frequency = snapshot["word_frequency"]
+        subdomains = SortedCounts(snapshot["subdomains"])
+        previous_hashes = snapshot["previous_hashes"]
+        # Checkpoints from before the budget index have none
+        if "budget" in snapshot:
+            budget.set_state(snapshot["budget"])
+        trap_detector.set_state(snapshot["traps"])
+        if near_duplicates is not None:
+            # Older checkpoints have 0 for pages without words
+            for fingerprint in snapshot["near_duplicates"]:
+                if fingerprint:
+                    near_duplicates.add(fingerprint)
+    for pages in deltas:
+        for page in pages:
+            count_page(*page)
+    merge_stats()
+    print(f'Resumed statistics of {count} pages from {checkpoint.path}')
+    # Compact the replayed deltas (and drop any record cut short by a crash)
+    checkpoint.write_snapshot(snapshot_state())
+
+def save_checkpoint(full=False):
+    # Append the pages counted since the last call, and write a full
+    # snapshot every checkpoint_snapshot deltas or when asked to
+    global pending_pages
+    if checkpoint is None:
+        return
+    with checkpoint_lock:
+        pages, pending_pages = pending_pages, []
+        if full or checkpoint.deltas >= checkpoint_snapshot:
+            checkpoint.write_snapshot(snapshot_state())
+        elif pages:
+            checkpoint.append_delta(pages)
+
+def flush_checkpoint():
+    # Append the pages counted since the last delta, without a snapshot.
+    # The frontier calls this before it commits urls as completed.
+    global pending_pages
+    if checkpoint is None:
+        return
+    with checkpoint_lock:
+        pages, pending_pages = pending_pages, []
+        if pages:
+            checkpoint.append_delta(pages)
+
+def normalize(url, parsed_url=None):
     # Normalizes url by getting rid of duplicates in path
-    parsed_url = urlparse(url)
+    if parsed_url is None:
+        parsed_url = urlparse(url)
     path_segments = []
 
     for segment in parsed_url.path.split('/'):
@@ -47,58 +244,64 @@ def calculate_hash(content):
 
 def record_data():
     # Log all data to it's files
-
-    # Record number of unique pages
-    num_unique_pages = len(unique_pages)
-    with open("UniquePages.txt", "a") as file:
-        file.write("Number of Unique Pages: " + str(num_unique_pages) + "\n")
-
-    # Record longest page in terms of words
-    longest_page = longest_page_words[0]
-    longest_page_count = longest_page_words[1]
-    with open("Longestpage.txt", "a") as file:
-        file.write("Longest Page: " + str(longest_page) + "\n")
-        file.write("Number of words: " + str(longest_page_count) + "\n")
-
-    # Record most common 50 words
-    sorted_word_frequency = dict(sorted(word_frequency.items(), key=lambda item: (-item[1], item[0])))
-    with open("TopWords.txt", "a") as file:
-        # Iterate over dictionary
-        timeCounter = 0
-        for word, frequency in sorted_word_frequency.items():
-            file.write(f"{word}: {frequency}\n")
-            # Break the loop when 50 items are written
-            if timeCounter >= 50:
-                break
-            timeCounter += 1
-        file.write(f"-------------------\n")
-
-    # Record all subdomains under ics.uci.edu
-    sorted_subdomains = dict(sorted(subdomains.items()))
-    with open("Subdomains.txt", "a") as file:
-        # Iterate over dictionary
-        for sub, frequency in sorted_subdomains.items():
-            file.write(f"{sub}: {frequency}\n")
-        file.write(f"-------------------\n")
-
-    return
-
-def scraper(url, resp):
+    save_checkpoint(full=True)
+    write_reports(report_data())
+
+def report_data():
+    # Everything the reports show (see utils/report.py), from the merged
+    # statistics. Safe to call from any thread while workers are running.
+    with merge_lock:
+        merge_stats()
+        return {
+            "pages": count,
+            "unique_pages": len(unique_pages),
+            "longest_page": {"url": longest_page_words[0], "words": longest_page_words[1]},
+            # Most common words, kept up to date by the counter
+            "top_words": word_frequency.top(top_words),
+            # All subdomains under ics.uci.edu
+            "subdomains": subdomains.sorted_items(),
+            # How much memory the dedup structures take
+            "memory": memory_report(),
+            # The url templates blocked as traps and the directories pruned or
+            # throttled for low yield, and why
+            "traps": sorted(dict(trap_detector.blocked).items()) + budget.report(),
+        }
+
+def memory_report():
+    # Approximate bytes used by the structures that grow with the crawl
+    return {
+        "visited_urls": visited_urls.memory_bytes(),
+        "normalized_paths": normalized_paths.memory_bytes(),
+        "unique_pages": sys.getsizeof(unique_pages) + 32 * len(unique_pages),
+        "previous_hashes": sys.getsizeof(previous_hashes) + 32 * len(previous_hashes),
+        "budget": budget.memory_bytes(),
+    }
+
+def scraper(url, resp, analysis=None):
+    # analysis: optional PageAnalysis of resp computed ahead of time, e.g. in
+    # the process pool of crawler/pipeline.py
+    return scrape(url, resp, analysis)[0]
+
+def scrape(url, resp, analysis=None, previous=None):
+    # scraper() that also returns the links that were seen before, for
+    # Frontier.linked(), and the page it counted, as passed to count_page(),
+    # or None. previous is the page counted for the url on an
+    # earlier visit, which is taken out of the statistics first.
     global unique_pages
     global longest_page_words
     global word_frequency
     global subdomains
     global visited_urls
     global count
-    global previous_links
     global previous_hashes
-    global depth_dict
     global normalized_paths
 
+    if previous is not None:
+        uncount_page(previous)
+
     if url != resp.url:
         # if it is a redirect, index original url so it doesn't visit again
-        visited_urls.add(url)
-        previous_links.append(url)
+        visited_urls.add(frontier_normalize(url))
         norm1 = normalize(url)
         normalized_paths.add(norm1)
 
@@ -106,109 +309,88 @@ def scraper(url, resp):
     url = resp.url
     url = url.split("#")[0]
 
-    # Get current depth based on first / after path
     parsed_url = urlparse(url)
 
-    # Get the first part of the path
-    if parsed_url.path:
-        first_part_path = parsed_url.path.split('/', 2)[1]
-    else:
-        first_part_path = ""
-
-    # Reconstruct the URL with the first part of the path
-    first_part_url = f"{parsed_url.scheme}://{parsed_url.netloc}/{first_part_path}"
-
-    if first_part_url not in depth_dict:
-        depth_dict[first_part_url] = 0
-    
-    current_depth = depth_dict[first_part_url]
-
-    # Don't crawl if over depth limit
-    if current_depth > 500:
-        return []
-
     # Add url to visited
     # visited_urls contains all visited urls, the entire url (not used for counting unique urls, only for not re-visiting)
-    visited_urls.add(url)
-    previous_links.append(url)
+    visited_urls.add(frontier_normalize(url))
     norm = normalize(url)
     normalized_paths.add(norm)
 
+    # Return empty links and don't count if bad status
+    if resp.status != 200 or resp.raw_response is None:
+        budget.fetched(url, parsed_url)
+        return [], [], None
+
     try:
         # Use a try in case it gives 200 but page doesn't exist
-        links = extract_next_links(url, resp)
+        # Parse the page once for links, words and its fingerprint
+        if analysis is None or analysis.url != url:
+            with metrics.timer("parse"):
+                analysis = analyze_page(url, resp.raw_response.content, parser_backend)
     except Exception as e:
         print('Exception: Error extracting next link')
-        return []
+        budget.fetched(url, parsed_url)
+        return [], [], None
 
-    # Return empty links and don't count if bad status
+    links = analysis.links
     if links == []:
-        return []
+        budget.fetched(url, parsed_url)
+        return [], [], None
 
-    # Calculate current hash and see if seen exact page before
-    current_hash = calculate_hash(resp.raw_response.content)
+    # See if seen exact page before
+    current_hash = int(analysis.fingerprint[:16], 16)
     if current_hash in previous_hashes:
         print('Not browsing, exact page has been seen')
-        return []
+        metrics.inc("exact_duplicates")
+        budget.fetched(url, parsed_url, duplicate=True)
+        return [], [], None
     else:
         previous_hashes.add(current_hash)
 
-
-    # Reset for memory
-    if len(previous_links) > 500:
-        previous_links = []
-
-    count += 1
-    print('Current count:' + str(count))
-
-    if count >= 300 and count % 300 == 0:
-        # call recording function
-        record_data()
-        pass
-
-    # Uniqueness is only established by URL, not fragment
-    unique_pages.add(url)
-
-    # Update longest page word count
-    update_longest_word_page(url, resp.raw_response.content)
-
-    # Update word frequency for current URL page
-    update_word_frequency(resp.raw_response.content)
-
-    # Total subdomains in the ics.uci.edu domain
-    update_subdomain(url)
+    # See if a page with nearly the same words has been seen before, pages
+    # without words have no fingerprint
+    if analysis.word_counts is None:
+        # Not analyzed by crawler.pipeline
+        analysis.word_counts = page_word_counts(analysis.words)
+        if near_duplicates is not None:
+            analysis.simhash = simhash(analysis.words)
+    fingerprint = None
+    if near_duplicates is not None:
+        fingerprint = analysis.simhash
+        if fingerprint is not None and near_duplicates.check_and_add(fingerprint):
+            print('Not browsing, near duplicate page has been seen')
+            metrics.inc("near_duplicates")
+            budget.fetched(url, parsed_url, duplicate=True)
+            return [], [], None
+
+    # Count the page in the statistics and remember it for the checkpoint
+    page = (url, current_hash, fingerprint, analysis.word_count, analysis.word_counts)
+    with metrics.timer("analytics"):
+        count_page(*page)
+    metrics.inc("pages_counted")
+    budget.fetched(url, parsed_url, unique=True)
+
+    remember_page(page)
 
     print(f"Visiting url : '{url}'")
 
-    frontier_list = [link for link in links if is_valid(link)]
-
-    # Add to seen urls
-    for link in frontier_list:
-       visited_urls.add(link)
-       previous_links.append(url)
+    # Every link is parsed once, in its canonical form
+    repeated_links = []
+    parsed_links = new_links(links, repeated_links)
+    frontier_list = [link for link, _ in parsed_links]
+    metrics.inc("links_found", len(links))
+    metrics.inc("links_valid", len(frontier_list))
+
+    # The frontier adds the links to visited_urls when it stores them
+    for link, parsed_url in parsed_links:
+       # Count the link against its url template for trap detection
+       trap_detector.record(link, parsed_url)
        # Also add normalized link into discovered
-       normalized_link = normalize(link)
+       normalized_link = normalize(link, parsed_url)
        normalized_paths.add(normalized_link)
         
-    for link in frontier_list:
-        # Get current depth based on first / after path
-        parsed_url = urlparse(link)
-
-        # Get the first part of the path
-        if parsed_url.path:
-            first_part_path = parsed_url.path.split('/', 2)[1]
-        else:
-            first_part_path = ""
-
-        # Reconstruct the URL with the first part of the path
-        first_part_url = f"{parsed_url.scheme}://{parsed_url.netloc}/{first_part_path}"
-
-        if first_part_url not in depth_dict:
-            depth_dict[first_part_url] = 0
-        else:
-            depth_dict[first_part_url] += 1
-
-    return frontier_list
+    return frontier_list, repeated_links, page
 
 def extract_next_links(url, resp):
     # Implementation required.
@@ -225,172 +407,184 @@ def extract_next_links(url, resp):
     if resp.status != 200:
         return []
 
-    # Parse HTML with beautiful soup
-    soup = BeautifulSoup(resp.raw_response.content, 'html.parser')
-
-    # Extract links from the html
-    links = []
-    # Find all links in the html
-    for link in soup.find_all('a'):
-        # Get href from each link
-        href = link.get('href')
-        # Join the original url with the new href and append
-        if href:
-            full_url = urljoin(url, href)
-            # Remove fragment from the full URL
-            full_url = full_url.split('#')[0]
-            links.append(full_url)
-
-    return links
+    # Links are absolute and have their fragment removed
+    return analyze_page(url, resp.raw_response.content, parser_backend).links
 
 
-def is_valid(url):
+def is_valid(url, parsed=None):
     # Decide whether to crawl this url or not. 
     # If you decide to crawl it, return True; otherwise return False.
     # There are already some conditions that return False.
+    # parsed: urlparse(url) if the caller already has it
     global visited_urls
     global normalized_paths
 
     try:
-        parsed = urlparse(url)
-        normal_link = normalize(url)
-        if normal_link in normalized_paths:
-            return False
-        if "filter" in url:
-            return False
-        if is_Trap(url):
+        if parsed is None:
+            parsed = urlparse(url)
+        # Cheap static rules first: scheme, domain, extension, substrings
+        if not url_filter.allows(url, parsed):
             return False
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        if correct_domain(url) == False:
+        return is_new(url, parsed)
+
+    except (TypeError, ValueError):
+        print ("Invalid url ", url)
+        return False
+
+def is_new(url, parsed):
+    # Checks against everything seen so far, for urls that pass the static rules
+    return not is_seen(url, parsed) and is_allowed(url, parsed)
+
+def is_seen(url, parsed):
+    return (normalize(url, parsed) in normalized_paths
+            or frontier_normalize(url) in visited_urls)
+
+def is_allowed(url, parsed):
+    # The rules for urls that were not seen before
+    if trap_detector.is_trap(url, parsed):
+        return False
+    # Only rules that are already cached, robots.txt is fetched by the workers
+    if robots.cache is not None and not robots.cache.allowed_cached(url, parsed):
+        return False
+    # Last, since it counts the links into throttled directories
+    return budget.admit(url, parsed)
+
+def is_crawlable(url):
+    # The rules of is_valid that do not depend on what was seen, for urls the
+    # frontier already stored
+    try:
+        parsed = urlparse(url)
+        if not url_filter.allows(url, parsed) or trap_detector.is_trap(url, parsed):
             return False
-        if url in visited_urls:
+        if budget.pruned(url, parsed):
             return False
-       # if not robots_valid_search(url):
-        #    return False
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r" |png|tiff?|mid|mp2|mp3|mp4"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz)$", parsed.path.lower())
-
-    except TypeError:
-        print ("TypeError for ", parsed)
-        raise
+        return robots.cache is None or robots.cache.allowed_cached(url, parsed)
+    except (TypeError, ValueError):
+        return False
+
+def valid_links(links):
+    # Batch version of is_valid for all links of a page: drops duplicates and
+    # parses each link only once
+    return [url for url, _ in new_links(links)]
+
+def new_links(links, repeats=None):
+    # valid_links as (canonical url, parsed url) pairs. Links that visited_urls
+    # has seen before are appended to repeats, if given, for the frontier to
+    # check exactly since the filter can be wrong about them.
+    new = []
+    for url, parsed in url_filter.filter_links(links):
+        if frontier_normalize(url) in visited_urls:
+            if repeats is not None:
+                repeats.append(url)
+        elif normalize(url, parsed) not in normalized_paths and is_allowed(url, parsed):
+            new.append((url, parsed))
+    return new
 
 def correct_domain(url):
-    parsed_url = urlparse(url)
-    domain = parsed_url.netloc
     # Return true if in specified domains
-    if domain == "ics.uci.edu" or domain.endswith(".ics.uci.edu"):
-        return True
-    if domain == "cs.uci.edu" or domain.endswith(".cs.uci.edu"):
-        return True
-    if domain == "informatics.uci.edu" or domain.endswith(".informatics.uci.edu"):
-        return True
-    if domain == "stat.uci.edu" or domain.endswith(".stat.uci.edu"):
-        return True
-    return False
+    return url_filter.allows_domain(urlparse(url).netloc)
 
 def is_Trap(url):
-    global previous_links
-
-    if len(previous_links) > 150:
+    # A url is a trap if its template was blocked for producing too many urls
+    # or its path is suspiciously deep or repetitive
+    return trap_detector.is_trap(url)
+
+
+def remember_page(entry):
+    # Queues the arguments of a count_page() call for the next checkpoint delta
+    if checkpoint is None:
+        return
+    # Under the lock save_checkpoint() swaps the list under
+    with checkpoint_lock:
+        pending_pages.append(entry)
+        due = len(pending_pages) >= checkpoint_pages
+    if due:
+        save_checkpoint()
+
+
+def uncount_page(page):
+    # Takes a page counted on an earlier visit out of the statistics, before
+    # its new version is counted
+    count_page(*page, pages=-1)
+    metrics.inc("pages_uncounted")
+    remember_page(page + (-1,))
+
+
+def count_page(url, page_hash, fingerprint, word_count, word_counts, pages=1):
+    # Adds a crawled page to the statistics, also used to replay checkpoints.
+    # pages=-1 takes a page out again (see uncount_page).
+    if pages < 0:
+        previous_hashes.discard(page_hash)
+        if fingerprint and near_duplicates is not None:
+            near_duplicates.remove(fingerprint)
+        negated = {word: -amount for word, amount in word_counts.items()}
+        page_stats.get().add(url, 0, negated, page_subdomain(url), pages)
+        return
+
+    previous_hashes.add(page_hash)
+    if fingerprint and near_duplicates is not None:
+        near_duplicates.check_and_add(fingerprint)
 
-        # Loop through previous 140 URLs
-        for i in range(-1, -140, -1):
-            past_url = previous_links[i]
-
-            url_length = len(url)
-            num_differences = 0
-
-            if url_length != len(past_url):
-                return False
-            
-            # Loop through each past URL and compare to current
-            for j in range(url_length):
+    # Uniqueness is only established by URL, not fragment
+    # A page of an older checkpoint may be known by the key of its url
+    if not (legacy_unique_pages and key64(url) in unique_pages):
+        unique_pages.add(canonical_key(url))
 
-                if url[j] != past_url[j]:
-                    num_differences += 1
+    # Page count, longest page, word frequency and subdomains in the
+    # ics.uci.edu domain go to this thread's accumulator first
+    counted = page_stats.get().add(url, word_count, word_counts, page_subdomain(url))
+    if counted >= merge_pages:
+        merge_stats()
 
-            if num_differences > 3:
-                # Not in trap if URLs differ by more than 3 characters
-                return False
-            else:
-                # Reset for next URL
-                num_differences = 0
-        # If it loops through all 20 URLs and their differences arent high enough, you are in a trap
-        # with open("TestTrap.txt", "a") as file:
-        #     file.write("It's a trap " + url + "\n")
-        return True
 
-    else:
-        # False (Not in trap) if haven't even visited 150 urls yet
-        return False
+def merge_stats():
+    # Fold the pages every thread counted since the last merge into the
+    # global statistics
+    global count
+    with merge_lock:
+        for pages, longest, word_counts, domains in page_stats.take_all():
+            if not (pages or word_counts or domains or longest[1]):
+                continue
+            count += pages
+            update_longest_word_page(*longest)
+            update_word_frequency(word_counts)
+            update_subdomains(domains)
 
 
-def update_longest_word_page(url, page_content):
+def update_longest_word_page(url, word_count):
     global longest_page_words
 
-    # Parse the page content with beautiful soup
-    soup = BeautifulSoup(page_content, 'html.parser')
-    # Get the actual text content fromt he created soup
-    text_content = soup.get_text(separator = ' ')
-    # extract all the words using regex
-    extracted_words = re.findall(r'\b[A-Za-z]+\b', text_content)
-
-    word_count = len(extracted_words)
-
     if (word_count > longest_page_words[1]):
         longest_page_words[0] = url
         longest_page_words[1] = word_count
 
 
-def update_word_frequency(page_content):
-    global word_frequency
-
-    english_stopwords = {'a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an', 
-    'and', 'any', 'are', "aren't", 'as', 'at', 'be', 'because', 'been', 'before', 'being', 'below', 
-    'between', 'both', 'but', 'by', "can't", 'cannot', 'could', "couldn't", 'did', "didn't", 'do', 'does', 
-    "doesn't", 'doing', "don't", 'down', 'during', 'each', 'few', 'for', 'from', 'further', 'had', "hadn't", 
-    'has', "hasn't", 'have', "haven't", 'having', 'he', "he'd", "he'll", "he's", 'her', 'here', "here's", 'hers', 
-    'herself', 'him', 'himself', 'his', 'how', "how's", 'i', "i'd", "i'll", "i'm", "i've", 'if', 'in', 'into', 'is', 
-    "isn't", 'it', "it's", 'its', 'itself', "let's", 'me', 'more', 'most', "mustn't", 'my', 'myself', 'no', 'nor', 
-    'not', 'of', 'off', 'on', 'once', 'only', 'or', 'other', 'ought', 'our', 'ours', '', '', '', 'ourselves', 'out', 
-    'over', 'own', 'same', "shan't", 'she', "she'd", "she'll", "she's", 'should', "shouldn't", 'so', 'some', 'such', 
-    'than', 'that', "that's", 'the', 'their', 'theirs', 'them', 'themselves', 'then', 'there', "there's", 'these', 
-    'they', "they'd", "they'll", "they're", "they've", 'this', 'those', 'through', 'to', 'too', 'under', 'until', 
-    'up', 'very', 'was', "wasn't", 'we', "we'd", "we'll", "we're", "we've", 'were', "weren't", 'what', "what's", 
-    'when', "when's", 'where', "where's", 'which', 'while', 'who', "who's", 'whom', 'why', "why's", 'with', "won't", 'would', 
-    "wouldn't", 'you', "you'd", "you'll", "you're", "you've", 'your', 'yours', 'yourself', 'yourselves'}
-
-    # Parse the page content with beautiful soup
-    soup = BeautifulSoup(page_content, 'html.parser')
-    # Get the actual text content fromt he created soup
-    text_content = soup.get_text(separator = ' ')
-    # extract all the words using regex
-    extracted_words = re.findall(r'\b[A-Za-z]+\b', text_content)
-
-    # Update frequency for each word
+def page_word_counts(extracted_words):
+    # Count the real words of a page, ignoring stopwords and single letters
+    word_counts = {}
     for word in extracted_words:
         word = word.lower()
 
-        if len(word) > 1:
-            # Only do real words
-            if word not in word_frequency and word not in english_stopwords:
-                word_frequency[word] = 1
-            elif word in word_frequency and word not in english_stopwords:
-                word_frequency[word] += 1
+        if len(word) > 1 and word not in ENGLISH_STOPWORDS:
+            if word not in word_counts:
+                word_counts[word] = 1
             else:
-                pass
+                word_counts[word] += 1
+    return word_counts
+
+def update_word_frequency(word_counts):
+    global word_frequency
+
+    # Update frequency for each word
+    word_frequency.update_many(word_counts)
 
-def update_subdomain(url):
+def update_subdomains(counts):
     global subdomains
 
+    for domain, amount in counts.items():
+        subdomains.add(domain, amount)
+
+def page_subdomain(url):
     # Only count subdomains in the ics.uci.edu domain
     parsed_url = urlparse(url)
     # Get subdomain by splitting once at the first period
@@ -402,32 +596,5 @@ def update_subdomain(url):
 
     # Check if the domain ends with ics.uci.edu
     if domain.endswith('.ics.uci.edu'):
-        # Increment the subdomain's count
-        if domain not in subdomains:
-            subdomains[domain] = 1
-        else:
-            subdomains[domain] += 1
-
-def robots_valid_search(url):
-    try:
-        # gets site portion of url
-        site = urlparse(url).netloc
-        # gets robots txt of that site
-        robots_txt_url = f"http://{site}/robots.txt"
-        robotUrl = requests.get(robots_txt_url)
-
-        # if robots site can successfully be reached
-        if robotUrl.status_code == 200:
-            txt = robotUrl.text # the content of robots
-            # goes through every line of the content and determines which are disallowed
-            for line in txt.split('\n'):
-                if line.strip().startswith('Disallow:'):
-                    disallowed_path = line.split(': ')[1].strip()
-                    if url.endswith(disallowed_path):
-                        return False
-            return True 
-        else:
-            return True
-    # throws exception
-    except Exception as e:
-        return True
\ No newline at end of file
+        return domain
+    return None
@@ -1,8 +1,11 @@
 import os
 import logging
 from hashlib import sha256
+from functools import lru_cache
 from urllib.parse import urlparse
 
+from utils.canonical import canonicalize
+
 def get_logger(name, filename=None):
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
@@ -22,6 +25,8 @@ def get_logger(name, filename=None):
     return logger
 
 
+# The same url is hashed when it is added, completed and archived
+@lru_cache(maxsize=65536)
 def get_urlhash(url):
     parsed = urlparse(url)
     # everything other than scheme.
@@ -30,6 +35,5 @@ def get_urlhash(url):
         f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
 
 def normalize(url):
-    if url.endswith("/"):
-        return url.rstrip("/")
-    return url
+    # The form urls are stored in, see utils/canonical.py
+    return canonicalize(url)
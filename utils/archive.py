@@ -0,0 +1,220 @@
+import os
+import gzip
+import uuid
+import sqlite3
+from datetime import datetime, timezone
+from threading import RLock
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from utils import get_logger, get_urlhash
+from utils.response import Response
+
+EXTENSIONS = {"gzip": ".warc.gz", "zstd": ".warc.zst"}
+
+
+class ArchivedPage(object):
+    def __init__(self, url, final_url, status, content, headers):
+        self.url = url
+        self.final_url = final_url
+        self.status = status
+        self.content = content
+        self.headers = headers
+
+    def response(self):
+        ''' The page as the Response that download() returned for it. '''
+        return Response({
+            "url": self.final_url, "status": self.status, "content": self.content,
+            "headers": self.headers})
+
+
+def _record(url, resp):
+    # A WARC style record: header lines, a blank line, the content
+    content = resp.content
+    headers = [
+        "WARC/1.0",
+        "WARC-Type: response",
+        f"WARC-Target-URI: {url}",
+        f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}",
+        f"WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>",
+        f"X-Final-URI: {resp.url}",
+        f"X-Status: {resp.status}",
+    ]
+    content_type = resp.headers.get("Content-Type")
+    if content_type:
+        headers.append(f"Content-Type: {content_type}")
+    headers.append(f"Content-Length: {len(content)}")
+    return b"".join((
+        "\r\n".join(headers).encode("utf-8"), b"\r\n\r\n", content, b"\r\n\r\n"))
+
+
+def _parse_record(data):
+    head, _, rest = data.partition(b"\r\n\r\n")
+    fields = dict()
+    for line in head.decode("utf-8").split("\r\n")[1:]:
+        name, _, value = line.partition(": ")
+        fields[name] = value
+    content = rest[:int(fields["Content-Length"])]
+    headers = {"Content-Type": fields["Content-Type"]} if "Content-Type" in fields else {}
+    return ArchivedPage(
+        fields["WARC-Target-URI"], fields["X-Final-URI"], int(fields["X-Status"]),
+        content, headers)
+
+
+class PageArchive(object):
+    ''' Append-only archive of downloaded pages.
+
+        Pages are written to segment files of about segment_bytes as WARC
+        style records, every record compressed on its own (a gzip member or
+        a zstd frame), so a record can be read from its offset alone and a
+        segment is still a valid .warc.gz / .warc.zst file. A SQLite index
+        maps each urlhash to (segment, offset, length); the latest download
+        of a url wins. Every run appends to a new segment, so a crash can
+        only cut short the tail of the last one. '''
+
+    def __init__(self, directory, compression="gzip", segment_bytes=64 * 1024 * 1024,
+                 batch_size=100):
+        self.logger = get_logger("ARCHIVE")
+        if compression == "zstd" and zstandard is None:
+            self.logger.error("zstandard is not installed, archiving with gzip.")
+            compression = "gzip"
+        self.directory = directory
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        self.batch_size = batch_size
+        self.lock = RLock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(
+            os.path.join(directory, "index.db"), check_same_thread=False,
+            isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "urlhash TEXT PRIMARY KEY, url TEXT NOT NULL, segment TEXT NOT NULL, "
+            "offset INTEGER NOT NULL, length INTEGER NOT NULL)")
+        # Index rows not committed yet
+        self.pending = []
+        self.segment = None
+        self.file = None
+        self.readers = dict()
+
+    def _compress(self, data):
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor(level=3).compress(data)
+        return gzip.compress(data, compresslevel=6)
+
+    @staticmethod
+    def _decompress(segment, data):
+        if segment.endswith(EXTENSIONS["zstd"]):
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def _next_segment(self):
+        if self.file is not None:
+            self.file.close()
+        number = len([
+            name for name in os.listdir(self.directory) if name.startswith("pages-")])
+        self.segment = f"pages-{number:05d}{EXTENSIONS[self.compression]}"
+        self.file = open(os.path.join(self.directory, self.segment), "ab")
+
+    def put(self, url, resp):
+        ''' Archives the content of a downloaded page under the url it was
+            requested by. '''
+        data = self._compress(_record(url, resp))
+        with self.lock:
+            if self.file is None or self.file.tell() >= self.segment_bytes:
+                self._next_segment()
+            offset = self.file.tell()
+            self.file.write(data)
+            self.pending.append((get_urlhash(url), url, self.segment, offset, len(data)))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            # Records reach the file before the index points to them
+            self.file.flush()
+            self.db.execute("BEGIN")
+            self.db.executemany(
+                "INSERT OR REPLACE INTO pages (urlhash, url, segment, offset, length) "
+                "VALUES (?, ?, ?, ?, ?)", self.pending)
+            self.db.execute("COMMIT")
+            self.pending.clear()
+
+    def _read(self, segment, offset, length):
+        reader = self.readers.get(segment)
+        if reader is None:
+            reader = self.readers[segment] = open(
+                os.path.join(self.directory, segment), "rb")
+        reader.seek(offset)
+        return _parse_record(self._decompress(segment, reader.read(length)))
+
+    def get(self, url):
+        ''' The latest archived download of the url, or None. '''
+        self.flush()
+        row = self.db.execute(
+            "SELECT segment, offset, length FROM pages WHERE urlhash = ?",
+            (get_urlhash(url),)).fetchone()
+        if row is None:
+            return None
+        with self.lock:
+            return self._read(*row)
+
+    def __contains__(self, url):
+        self.flush()
+        return self.db.execute(
+            "SELECT 1 FROM pages WHERE urlhash = ?", (get_urlhash(url),)).fetchone() is not None
+
+    def __len__(self):
+        self.flush()
+        return self.db.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def pages(self):
+        ''' Yields every archived page, segment by segment in file order so
+            the segments are read sequentially. '''
+        self.flush()
+        rows = self.db.execute(
+            "SELECT segment, offset, length FROM pages ORDER BY segment, offset")
+        for segment, offset, length in rows:
+            try:
+                yield self._read(segment, offset, length)
+            except (OSError, EOFError, ValueError, KeyError) as e:
+                self.logger.error(f"Skipping damaged record in {segment} at {offset}: {e}")
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+            for reader in self.readers.values():
+                reader.close()
+            self.readers.clear()
+
+
+# Page archive of this crawler process, None unless ARCHIVE is set.
+current = None
+
+
+def start(config):
+    ''' Opens the archive in the ARCHIVE directory of config.ini. '''
+    global current
+    if config.archive and current is None:
+        current = PageArchive(
+            config.archive, config.archive_compression,
+            config.archive_segment_mb * 1024 * 1024)
+    return current
+
+
+def stop():
+    global current
+    if current is not None:
+        current.close()
+        current = None
@@ -0,0 +1,104 @@
+import math
+from hashlib import blake2b
+from threading import Lock
+
+
+def key64(key):
+    ''' 64 bit key for a string, bytes or int. '''
+    if isinstance(key, int):
+        return key & 0xFFFFFFFFFFFFFFFF
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    return int.from_bytes(blake2b(key, digest_size=8).digest(), "big")
+
+
+class BloomFilter(object):
+    ''' Fixed size Bloom filter over 64 bit keys. '''
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        # Optimal number of bits and hash functions for the capacity
+        self.num_bits = max(8, int(
+            -self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: the two halves of the 64 bit key give every index
+        low, high = key & 0xFFFFFFFF, (key >> 32) | 1
+        for i in range(self.num_hashes):
+            yield (low + i * high) % self.num_bits
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        bits = self.bits
+        for p in self._positions(key):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def memory_bytes(self):
+        return len(self.bits)
+
+
+class ScalableBloomFilter(object):
+    ''' Bloom filter that grows by adding larger filters with tighter error
+        rates, so the overall false positive rate stays near error_rate no
+        matter how many keys are added. Keys are hashed to 64 bits first, so
+        the filter never holds on to the strings themselves.
+
+        There are no false negatives: a key that is not in the filter was
+        never added. Use an exact structure to confirm hits where a false
+        positive matters. '''
+
+    def __init__(self, initial_capacity=100000, error_rate=0.001, growth=2,
+                 tightening=0.5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+        self.count = 0
+        self.lock = Lock()
+        self._grow()
+
+    def _grow(self):
+        size = len(self.filters)
+        self.filters.append(BloomFilter(
+            self.initial_capacity * self.growth ** size,
+            self.error_rate * (1 - self.tightening) * self.tightening ** size))
+
+    def __contains__(self, key):
+        key = key64(key)
+        return any(key in bloom for bloom in reversed(self.filters))
+
+    def add(self, key):
+        ''' Adds the key. Returns True if it was (probably) not there before. '''
+        key = key64(key)
+        with self.lock:
+            if any(key in bloom for bloom in reversed(self.filters)):
+                return False
+            if self.filters[-1].count >= self.filters[-1].capacity:
+                self._grow()
+            self.filters[-1].add(key)
+            self.count += 1
+            return True
+
+    def __len__(self):
+        return self.count
+
+    def memory_bytes(self):
+        return sum(bloom.memory_bytes() for bloom in self.filters)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+
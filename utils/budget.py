@@ -0,0 +1,166 @@
+import sys
+from math import ceil
+from threading import Lock
+from urllib.parse import urlparse
+
+
+class BudgetNode(object):
+    __slots__ = ("children", "fetched", "unique", "duplicates", "offered")
+
+    def __init__(self):
+        self.children = dict()
+        # Pages fetched below this node, how many of them were counted as
+        # new content and how many were duplicates. Decayed, see fetched().
+        self.fetched = 0.0
+        self.unique = 0.0
+        self.duplicates = 0.0
+        # New links offered while throttled, to admit every n-th of them
+        self.offered = 0
+
+    def yield_ratio(self):
+        return self.unique / self.fetched if self.fetched else 1.0
+
+
+class BudgetIndex(object):
+    ''' Trie over host and directory segments that tracks, at every level,
+        the pages fetched below it, how many of them were new content and
+        how many duplicates.
+
+        Once a subtree has min_pages fetched pages, its yield (new pages per
+        fetched page) decides what happens to new links into it: below
+        min_yield the subtree is pruned and its links are dropped, below
+        throttle_yield only every n-th link is admitted, with n growing as
+        the yield falls. Counts are halved once a node reaches 4 *
+        min_pages, so the yield follows what the subtree produces lately.
+        A page's file name is not a level, so the trie grows with the
+        directories of the crawl rather than its urls. '''
+
+    def __init__(self, min_pages=50, min_yield=0.05, throttle_yield=0.3, max_depth=8):
+        self.min_pages = min_pages
+        self.min_yield = min_yield
+        self.throttle_yield = max(throttle_yield, min_yield)
+        self.max_depth = max_depth
+        self.root = BudgetNode()
+        self.nodes = 1
+        self.lock = Lock()
+
+    def _levels(self, parsed):
+        return [parsed.netloc.lower()] + [
+            segment for segment in parsed.path.split("/")[:-1] if segment][:self.max_depth]
+
+    def _walk(self, parsed):
+        # Existing nodes from the host down along the url's directories
+        node = self.root
+        for level in self._levels(parsed):
+            node = node.children.get(level)
+            if node is None:
+                return
+            yield node
+
+    def fetched(self, url, parsed=None, unique=False, duplicate=False):
+        ''' Records a fetched page, which was new content (unique), a
+            duplicate of an earlier page, or neither (an error page, a page
+            without links). '''
+        if not self.min_pages:
+            return
+        if parsed is None:
+            parsed = urlparse(url)
+        with self.lock:
+            node = self.root
+            for level in self._levels(parsed):
+                child = node.children.get(level)
+                if child is None:
+                    child = node.children[level] = BudgetNode()
+                    self.nodes += 1
+                node = child
+                node.fetched += 1
+                node.unique += unique
+                node.duplicates += duplicate
+                if node.fetched >= 4 * self.min_pages:
+                    node.fetched /= 2
+                    node.unique /= 2
+                    node.duplicates /= 2
+
+    def _stride(self, node):
+        # Admit one in stride new links into the node's subtree, 0 = none
+        if node.fetched < self.min_pages:
+            return 1
+        ratio = node.yield_ratio()
+        if ratio < self.min_yield:
+            return 0
+        if ratio < self.throttle_yield:
+            return ceil(self.throttle_yield / ratio)
+        return 1
+
+    def admit(self, url, parsed=None):
+        ''' Whether a new link may be crawled. Counts towards throttling,
+            so call it once per link. '''
+        if not self.min_pages:
+            return True
+        if parsed is None:
+            parsed = urlparse(url)
+        with self.lock:
+            stride = 1
+            throttled = None
+            for node in self._walk(parsed):
+                node_stride = self._stride(node)
+                if node_stride == 0:
+                    return False
+                if node_stride > stride:
+                    stride, throttled = node_stride, node
+            if throttled is None:
+                return True
+            throttled.offered += 1
+            return (throttled.offered - 1) % stride == 0
+
+    def pruned(self, url, parsed=None):
+        ''' Whether the url lies in a pruned subtree. '''
+        if not self.min_pages:
+            return False
+        if parsed is None:
+            parsed = urlparse(url)
+        with self.lock:
+            return any(self._stride(node) == 0 for node in self._walk(parsed))
+
+    def report(self):
+        ''' (prefix, reason) of every pruned or throttled subtree that is not
+            inside another one. '''
+        found = []
+        with self.lock:
+            stack = [("", self.root)]
+            while stack:
+                prefix, node = stack.pop()
+                for level, child in node.children.items():
+                    path = f"{prefix}/{level}" if prefix else level
+                    stride = self._stride(child)
+                    if stride == 1:
+                        stack.append((path, child))
+                        continue
+                    action = "pruned" if stride == 0 else f"throttled to 1 in {stride} links"
+                    found.append((
+                        path + "/",
+                        f"{action}: yield {child.yield_ratio():.0%}, duplicates "
+                        f"{child.duplicates / child.fetched:.0%} of {child.fetched:.0f} pages"))
+        return sorted(found)
+
+    def memory_bytes(self):
+        return self.nodes * (sys.getsizeof(BudgetNode()) + sys.getsizeof({}))
+
+    def get_state(self):
+        ''' Picklable copy of the trie, for checkpoints. '''
+        def dump(node):
+            return (node.fetched, node.unique, node.duplicates,
+                    {level: dump(child) for level, child in node.children.items()})
+        with self.lock:
+            return dump(self.root)
+
+    def set_state(self, state):
+        def load(data):
+            node = BudgetNode()
+            node.fetched, node.unique, node.duplicates, children = data
+            node.children = {level: load(child) for level, child in children.items()}
+            self.nodes += 1
+            return node
+        with self.lock:
+            self.nodes = 0
+            self.root = load(state)
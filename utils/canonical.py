@@ -0,0 +1,89 @@
+from functools import lru_cache
+from urllib.parse import urlparse, urlunparse, ParseResult
+
+from utils.bloom import key64
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = frozenset((
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "ref_src"))
+TRACKING_PREFIXES = ("utm_",)
+
+
+@lru_cache(maxsize=4096)
+def _netloc(scheme, netloc):
+    # Lowercase host without a trailing dot or the scheme's default port.
+    # Few distinct hosts are linked from everywhere, so this is cached on
+    # its own.
+    userinfo, at, host = netloc.rpartition("@")
+    host = host.lower()
+    if host.startswith("["):
+        # IPv6 literal, its colons are not a port
+        address, _, port = host.partition("]")
+        host, port = address + "]", port[1:]
+    else:
+        host, _, port = host.partition(":")
+    host = host.rstrip(".")
+    if port and port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{port}"
+    return f"{userinfo}{at}{host}"
+
+
+def _query(query):
+    # Sorted parameters without the tracking ones. Pairs are compared as
+    # they are written, so nothing is decoded and encoded again.
+    if not query:
+        return query
+    params = []
+    for param in query.split("&"):
+        if not param:
+            continue
+        name = param.split("=", 1)[0].lower()
+        if name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES):
+            continue
+        params.append(param)
+    params.sort()
+    return "&".join(params)
+
+
+@lru_cache(maxsize=65536)
+def _canonical(url):
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    parsed = ParseResult(
+        scheme, _netloc(scheme, parsed.netloc), parsed.path.rstrip("/"),
+        parsed.params, _query(parsed.query), "")
+    return urlunparse(parsed), parsed
+
+
+def canonicalize(url):
+    ''' The canonical form of an absolute url: lowercase scheme and host,
+        no default port, no trailing slash, no fragment and the query
+        sorted without tracking parameters. Raises ValueError for urls that
+        cannot be parsed. '''
+    return _canonical(url)[0]
+
+
+def canonical_parsed(url):
+    ''' (canonical url, its urlparse result) without parsing it again. '''
+    return _canonical(url)
+
+
+def canonical_key(url):
+    ''' 64 bit key of the canonical form of the url. '''
+    return key64(_canonical(url)[0])
+
+
+def canonicalize_many(urls):
+    ''' (canonical url, parsed) for a page's worth of urls, each canonical
+        url once and in order. Urls that cannot be parsed are dropped. '''
+    result = dict()
+    for url in urls:
+        try:
+            canonical, parsed = _canonical(url)
+        except ValueError:
+            continue
+        if canonical not in result:
+            result[canonical] = parsed
+    return list(result.items())
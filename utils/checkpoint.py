@@ -0,0 +1,87 @@
+import os
+import zlib
+import pickle
+import struct
+from threading import Lock
+
+# Every record is a 4 byte big endian length followed by a zlib compressed
+# pickle. The first record of the file is a full snapshot (or None), the
+# records after it are deltas written since that snapshot.
+HEADER = struct.Struct(">I")
+
+
+def _pack(obj):
+    data = zlib.compress(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+    return HEADER.pack(len(data)) + data
+
+
+class Checkpoint(object):
+    ''' Append-only checkpoint file made of a snapshot and deltas.
+
+        Deltas are cheap to append after every few pages. Once enough of
+        them pile up the owner writes a new snapshot, which atomically
+        replaces the file (temp file plus rename) and drops the deltas. '''
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+        self.deltas = 0
+        self.lock = Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.path)
+
+    def load(self):
+        ''' Returns (snapshot, deltas). A record cut short by a crash while it
+            was being written is ignored along with anything after it. '''
+        snapshot, deltas = None, []
+        if not self.exists():
+            return snapshot, deltas
+        with open(self.path, "rb") as file:
+            data = file.read()
+        offset, first = 0, True
+        while offset + HEADER.size <= len(data):
+            (length,) = HEADER.unpack_from(data, offset)
+            offset += HEADER.size
+            if offset + length > len(data):
+                break
+            try:
+                record = pickle.loads(zlib.decompress(data[offset:offset + length]))
+            except (zlib.error, pickle.UnpicklingError, EOFError):
+                break
+            offset += length
+            if first:
+                snapshot, first = record, False
+            else:
+                deltas.append(record)
+        self.deltas = len(deltas)
+        return snapshot, deltas
+
+    def _write(self, file):
+        file.flush()
+        if self.fsync:
+            os.fsync(file.fileno())
+
+    def write_snapshot(self, snapshot):
+        with self.lock:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as file:
+                file.write(_pack(snapshot))
+                self._write(file)
+            os.replace(tmp_path, self.path)
+            self.deltas = 0
+
+    def append_delta(self, delta):
+        with self.lock:
+            if not self.exists():
+                # Deltas need a snapshot record in front of them
+                with open(self.path, "wb") as file:
+                    file.write(_pack(None))
+            with open(self.path, "ab") as file:
+                file.write(_pack(delta))
+                self._write(file)
+            self.deltas += 1
@@ -1,5 +1,15 @@
 import re
 
+from utils.url_filter import DEFAULT_DOMAINS, DEFAULT_EXTENSIONS, DEFAULT_BLOCKED
+
+
+def _list(config, section, option, default):
+    # Comma separated option, or the default when it is not set
+    value = config.get(section, option, fallback=None)
+    if value is None:
+        return default
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
 
 class Config(object):
     def __init__(self, config):
@@ -8,12 +18,67 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.checkpoint_pages = config.getint("LOCAL PROPERTIES", "CHECKPOINT_PAGES", fallback=100)
+        self.checkpoint_snapshot = config.getint("LOCAL PROPERTIES", "CHECKPOINT_SNAPSHOT", fallback=20)
+        self.metrics_port = config.getint("LOCAL PROPERTIES", "METRICS_PORT", fallback=0)
+        self.metrics_interval = config.getfloat("LOCAL PROPERTIES", "METRICS_INTERVAL", fallback=30)
+        self.report_interval = config.getfloat("LOCAL PROPERTIES", "REPORT_INTERVAL", fallback=60)
+        self.report_pages = config.getint("LOCAL PROPERTIES", "REPORT_PAGES", fallback=300)
+        self.parse_processes = config.getint("LOCAL PROPERTIES", "PARSE_PROCESSES", fallback=0)
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.save_batch = config.getint("LOCAL PROPERTIES", "SAVE_BATCH", fallback=500)
+        self.save_interval = config.getfloat("LOCAL PROPERTIES", "SAVE_INTERVAL", fallback=5.0)
+        self.save_sync = config.get("LOCAL PROPERTIES", "SAVE_SYNC", fallback="NORMAL").strip().upper()
+        self.archive = config.get("LOCAL PROPERTIES", "ARCHIVE", fallback="").strip()
+        self.archive_compression = config.get("LOCAL PROPERTIES", "ARCHIVE_COMPRESSION", fallback="gzip").strip().lower()
+        self.archive_segment_mb = config.getint("LOCAL PROPERTIES", "ARCHIVE_SEGMENT_MB", fallback=64)
+        self.frontier_window = config.getint("LOCAL PROPERTIES", "FRONTIER_WINDOW", fallback=10000)
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.connect_timeout = config.getfloat("CONNECTION", "CONNECT_TIMEOUT", fallback=5.0)
+        self.download_timeout = config.getfloat("CONNECTION", "TIMEOUT", fallback=30.0)
+        self.download_retries = config.getint("CONNECTION", "RETRIES", fallback=3)
+        self.download_backoff = config.getfloat("CONNECTION", "BACKOFF", fallback=0.5)
+        self.max_attempts = config.getint("CONNECTION", "MAX_ATTEMPTS", fallback=3)
+        self.max_failures = config.getint("CONNECTION", "MAX_FAILURES", fallback=10)
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
+        self.politeness_max = config.getfloat("CRAWLER", "POLITENESS_MAX", fallback=30.0)
+        self.politeness_step = config.getfloat("CRAWLER", "POLITENESS_STEP", fallback=0.1)
+        self.politeness_backoff = config.getfloat("CRAWLER", "POLITENESS_BACKOFF", fallback=2.0)
+        self.frontier_priority = config.get("CRAWLER", "FRONTIER_PRIORITY", fallback="best").strip().lower()
+
+        self.filter_domains = _list(config, "FILTER", "DOMAINS", DEFAULT_DOMAINS)
+        self.filter_extensions = _list(config, "FILTER", "EXTENSIONS", DEFAULT_EXTENSIONS)
+        self.filter_blocked = _list(config, "FILTER", "BLOCKED", DEFAULT_BLOCKED)
+        self.parser_backend = config.get("CRAWLER", "PARSER", fallback="html.parser").strip()
+        self.trap_template_limit = config.getint("CRAWLER", "TRAP_TEMPLATE_LIMIT", fallback=200)
+        self.trap_half_life = config.getfloat("CRAWLER", "TRAP_HALF_LIFE", fallback=600.0)
+        self.budget_min_pages = config.getint("CRAWLER", "BUDGET_MIN_PAGES", fallback=50)
+        self.budget_min_yield = config.getfloat("CRAWLER", "BUDGET_MIN_YIELD", fallback=0.05)
+        self.budget_throttle_yield = config.getfloat("CRAWLER", "BUDGET_THROTTLE_YIELD", fallback=0.3)
+        self.top_words = config.getint("CRAWLER", "TOP_WORDS", fallback=50)
+        self.word_count_mode = config.get("CRAWLER", "WORD_COUNT_MODE", fallback="exact").strip().lower()
+        self.word_count_capacity = config.getint("CRAWLER", "WORD_COUNT_CAPACITY", fallback=10000)
+        self.seen_capacity = config.getint("CRAWLER", "SEEN_CAPACITY", fallback=100000)
+        self.seen_error_rate = config.getfloat("CRAWLER", "SEEN_ERROR_RATE", fallback=0.001)
+        self.near_duplicate_distance = config.getint("CRAWLER", "NEAR_DUPLICATE_DISTANCE", fallback=3)
+        self.robots = config.getboolean("CRAWLER", "ROBOTS", fallback=True)
+        self.robots_ttl = config.getfloat("CRAWLER", "ROBOTS_TTL", fallback=86400.0)
+        self.refresh_interval = config.getfloat("CRAWLER", "REFRESH_INTERVAL", fallback=86400.0)
+        self.refresh_min_interval = config.getfloat("CRAWLER", "REFRESH_MIN_INTERVAL", fallback=3600.0)
+        self.refresh_max_interval = config.getfloat("CRAWLER", "REFRESH_MAX_INTERVAL", fallback=30 * 86400.0)
+
+        self.shard_id = config.getint("SHARDING", "SHARD_ID", fallback=0)
+        self.shard_count = config.getint("SHARDING", "SHARD_COUNT", fallback=1)
+        assert 0 <= self.shard_id < self.shard_count, "SHARD_ID must be below SHARD_COUNT"
+        self.shard_transport = config.get("SHARDING", "TRANSPORT", fallback="spool").strip().lower()
+        self.shard_address = config.get("SHARDING", "ADDRESS", fallback="shards").strip()
+        self.shard_batch = config.getint("SHARDING", "BATCH", fallback=100)
+        self.shard_interval = config.getfloat("SHARDING", "INTERVAL", fallback=2.0)
 
+        # Visit the due urls of a finished crawl again, set by launch.py --refresh
+        self.refresh = False
         self.cache_server = None
\ No newline at end of file
@@ -1,21 +1,57 @@
 import requests
 import cbor
 import time
+from threading import Lock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from utils.response import Response
+from utils.metrics import metrics
 
-def download(url, config, logger=None):
-    host, port = config.cache_server
-    resp = requests.get(
-        f"http://{host}:{port}/",
-        params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
+# One pooled keep-alive session per cache server, shared by all workers.
+_sessions = dict()
+_sessions_lock = Lock()
+
+
+def get_session(config):
+    cache_server = tuple(config.cache_server)
+    with _sessions_lock:
+        session = _sessions.get(cache_server)
+        if session is None:
+            session = requests.Session()
+            # Retry connection errors with exponential backoff: backoff,
+            # 2 * backoff, 4 * backoff, ... Server errors are returned as
+            # they are, the politeness controller backs off on them.
+            retry = Retry(
+                total=config.download_retries,
+                backoff_factor=config.download_backoff)
+            adapter = HTTPAdapter(
+                pool_connections=1, pool_maxsize=max(1, config.threads_count),
+                max_retries=retry)
+            session.mount("http://", adapter)
+            _sessions[cache_server] = session
+        return session
+
+
+def _to_response(url, status_code, ok, content, logger=None):
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if ok and content:
+            with metrics.timer("decode_envelope"):
+                return Response(cbor.loads(content), status_code)
     except (EOFError, ValueError) as e:
         pass
-    logger.error(f"Spacetime Response error {resp} with url {url}.")
+    if logger:
+        logger.error(f"Spacetime Response error {status_code} with url {url}.")
     return Response({
-        "error": f"Spacetime Response error {resp} with url {url}.",
-        "status": resp.status_code,
-        "url": url})
+        "error": f"Spacetime Response error {status_code} with url {url}.",
+        "status": status_code,
+        "url": url}, status_code)
+
+
+def download(url, config, logger=None):
+    host, port = config.cache_server
+    resp = get_session(config).get(
+        f"http://{host}:{port}/",
+        params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+        timeout=(config.connect_timeout, config.download_timeout))
+    return _to_response(url, resp.status_code, resp.ok, resp.content, logger)
@@ -0,0 +1,161 @@
+import time
+from bisect import bisect_left
+from threading import Thread, Lock
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Upper bounds in seconds of the histogram buckets, from 1ms to 30s.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram(object):
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th quantile
+        rank, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics(object):
+    ''' Stage timings, counters and gauges of the crawl.
+
+        Gauges are callbacks evaluated when the metrics are read, so the
+        hot path only pays for observe() and inc(). A gauge callback can
+        return a number or a dict of label value -> number. '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self.histograms = dict()
+        self.counters = dict()
+        self.gauges = dict()
+        self.started = time.monotonic()
+
+    def observe(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def get(self, name):
+        return self.counters.get(name, 0)
+
+    def register_gauge(self, name, callback, label=None):
+        self.gauges[name] = (callback, label)
+
+    def _gauge_values(self):
+        values = dict()
+        for name, (callback, label) in list(self.gauges.items()):
+            try:
+                values[name] = (callback(), label)
+            except Exception:
+                continue
+        return values
+
+    def prometheus_text(self):
+        ''' All metrics in the Prometheus text exposition format. '''
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE crawler_{name}_total counter")
+                lines.append(f"crawler_{name}_total {value}")
+            for name, histogram in sorted(self.histograms.items()):
+                metric = f"crawler_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                cumulative = 0
+                for bound, count in zip(BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum {histogram.sum}")
+                lines.append(f"{metric}_count {histogram.count}")
+        for name, (value, label) in sorted(self._gauge_values().items()):
+            lines.append(f"# TYPE crawler_{name} gauge")
+            if isinstance(value, dict):
+                for key, item in sorted(value.items()):
+                    lines.append(f'crawler_{name}{{{label}="{key}"}} {item}')
+            else:
+                lines.append(f"crawler_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        ''' One line overview: throughput, stage means and p90s, gauges. '''
+        elapsed = time.monotonic() - self.started
+        parts = []
+        with self.lock:
+            pages = self.counters.get("pages_downloaded", 0)
+            parts.append(f"{pages} pages ({pages / elapsed:.2f}/s)")
+            for name, histogram in sorted(self.histograms.items()):
+                if histogram.count:
+                    parts.append(
+                        f"{name} {histogram.sum / histogram.count * 1000:.1f}ms"
+                        f" p90<{histogram.quantile(0.9) * 1000:g}ms")
+            for name, value in sorted(self.counters.items()):
+                if name != "pages_downloaded":
+                    parts.append(f"{name} {value}")
+        for name, (value, label) in sorted(self._gauge_values().items()):
+            if not isinstance(value, dict):
+                parts.append(f"{name} {value}")
+        return ", ".join(parts)
+
+
+# Metrics of this crawler process, shared by all modules.
+metrics = Metrics()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port):
+    ''' Serves the metrics at http://127.0.0.1:port/metrics. '''
+    server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_reporter(logger, interval):
+    ''' Logs the summary line every interval seconds. '''
+    def report():
+        while True:
+            time.sleep(interval)
+            logger.info(metrics.summary())
+    Thread(target=report, daemon=True).start()
@@ -0,0 +1,101 @@
+import re
+import hashlib
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+WORD_RE = re.compile(r'\b[A-Za-z]+\b')
+# Text inside these tags is never shown on the page.
+SKIPPED_TAGS = {"script", "style", "noscript", "template"}
+
+BACKENDS = ("html.parser", "lxml")
+
+
+class PageAnalysis(object):
+    ''' Everything the scraper needs from one page, computed in one pass. '''
+    def __init__(self, url, links, words, fingerprint):
+        self.url = url
+        # Absolute urls of all <a href> on the page, without fragments.
+        self.links = links
+        # All words on the page in order, as matched by WORD_RE.
+        self.words = words
+        self.word_count = len(words)
+        # sha256 hex digest of the raw page content.
+        self.fingerprint = fingerprint
+        # SimHash of the words and their counts without stopwords, filled in
+        # by crawler.pipeline off the worker thread, or else by the scraper.
+        self.simhash = None
+        self.word_counts = None
+
+
+class _StreamingParser(HTMLParser):
+    # Collects hrefs and visible text while the page is streamed through.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = []
+        self.text = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href" and value:
+                    self.hrefs.append(value)
+                    break
+        elif tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS and self.skip_depth:
+            self.skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.text.append(data)
+
+
+def _parse_html_parser(text):
+    parser = _StreamingParser()
+    parser.feed(text)
+    parser.close()
+    return parser.hrefs, parser.text
+
+
+def _parse_lxml(text):
+    document = lxml.html.fromstring(text)
+    hrefs = [href for href in (a.get("href") for a in document.iter("a")) if href]
+    etree.strip_elements(document, *SKIPPED_TAGS, with_tail=False)
+    return hrefs, list(document.itertext())
+
+
+def analyze_page(url, content, backend="html.parser"):
+    ''' Parses the page content once and returns a PageAnalysis.
+        backend is "html.parser" (standard library, streaming) or "lxml",
+        which falls back to "html.parser" when lxml is not installed. '''
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    fingerprint = hashlib.sha256(content).hexdigest()
+    # str() decodes a memoryview without copying it to bytes first
+    text = str(content, "utf-8", errors="replace")
+
+    hrefs, chunks = [], []
+    if text.strip():
+        if backend == "lxml" and lxml is not None:
+            try:
+                hrefs, chunks = _parse_lxml(text)
+            except (etree.ParserError, ValueError):
+                hrefs, chunks = _parse_html_parser(text)
+        else:
+            hrefs, chunks = _parse_html_parser(text)
+
+    links = []
+    for href in hrefs:
+        # Join the original url with the new href and drop the fragment
+        links.append(urljoin(url, href.strip()).split('#')[0])
+    words = WORD_RE.findall(' '.join(chunks))
+    return PageAnalysis(url, links, words, fingerprint)
@@ -13,3 +13,30 @@ class Register(object):
         self.load_balancer = tuple()
         self.fresh = fresh
         self.invalid = False
+
+
+@pcc_set
+class UrlBatch(object):
+    # Urls one crawler shard forwards to the shard that owns their hosts
+    batch_id = primarykey(str)
+    shard = dimension(int)
+    urls = dimension(tuple)
+
+    def __init__(self, batch_id, shard, urls):
+        self.batch_id = batch_id
+        self.shard = shard
+        self.urls = urls
+
+
+@pcc_set
+class ShardStatus(object):
+    shard_key = primarykey(str)
+    idle = dimension(bool)
+    run = dimension(str)
+    batches = dimension(int)
+
+    def __init__(self, shard_key):
+        self.shard_key = shard_key
+        self.idle = False
+        self.run = ""
+        self.batches = 0
@@ -0,0 +1,116 @@
+import os
+import json
+import time
+import tempfile
+from threading import Thread, Event
+
+from utils import get_logger
+
+SEPARATOR = "-------------------\n"
+
+
+def _write_atomic(path, text):
+    # Readers see either the old report or the new one, never half of it.
+    # Each writer has a file of its own, several may write at once.
+    directory, name = os.path.split(path)
+    with tempfile.NamedTemporaryFile(
+            "w", dir=directory or ".", prefix=name, suffix=".tmp",
+            delete=False) as file:
+        file.write(text)
+    os.replace(file.name, path)
+
+
+def text_reports(data):
+    ''' The text report files for data, as {file name: contents}. '''
+    longest = data["longest_page"]
+    return {
+        "UniquePages.txt": f"Number of Unique Pages: {data['unique_pages']}\n",
+        "Longestpage.txt": (
+            f"Longest Page: {longest['url']}\n"
+            f"Number of words: {longest['words']}\n"),
+        "TopWords.txt": "".join(
+            f"{word}: {frequency}\n" for word, frequency in data["top_words"]) + SEPARATOR,
+        "Subdomains.txt": "".join(
+            f"{sub}: {frequency}\n" for sub, frequency in data["subdomains"]) + SEPARATOR,
+        "Memory.txt": "".join(
+            f"{name}: {size} bytes\n" for name, size in data["memory"].items()) + SEPARATOR,
+        "Traps.txt": "".join(
+            f"{template}: {reason}\n" for template, reason in data["traps"]),
+    }
+
+
+def write_reports(data, directory="."):
+    ''' Replaces the text reports and Report.json in directory with data:
+        a dict of pages, unique_pages, longest_page {url, words}, top_words
+        and subdomains [(key, count)], memory {name: bytes} and traps
+        [(template, reason)]. '''
+    for name, text in text_reports(data).items():
+        _write_atomic(os.path.join(directory, name), text)
+    _write_atomic(
+        os.path.join(directory, "Report.json"),
+        json.dumps(dict(data, written=time.time()), indent=1))
+
+
+class ReportWriter(object):
+    ''' Writes the reports from a thread of its own every interval seconds
+        or once pages more pages were counted, whichever comes first, so
+        workers never wait for a report. collect() returns the data for
+        write_reports and progress() the number of pages counted so far. '''
+
+    def __init__(self, collect, progress, interval=60.0, pages=300, directory="."):
+        self.logger = get_logger("REPORT")
+        self.collect = collect
+        self.progress = progress
+        self.interval = interval
+        self.pages = pages
+        self.directory = directory
+        self.stopped = Event()
+        self.thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def _run(self):
+        last_time, last_pages = time.monotonic(), self.progress()
+        # Check often enough to notice the page interval, but cheaply
+        check = min(1.0, self.interval) if self.interval > 0 else 1.0
+        while not self.stopped.wait(check):
+            pages = self.progress()
+            if ((self.interval > 0 and time.monotonic() - last_time >= self.interval)
+                    or (self.pages > 0 and pages - last_pages >= self.pages)):
+                self.write()
+                last_time, last_pages = time.monotonic(), pages
+
+    def write(self):
+        try:
+            write_reports(self.collect(), self.directory)
+        except Exception:
+            self.logger.exception("Failed to write the reports.")
+
+    def stop(self):
+        ''' Stops the thread. The final reports are written by the crawler
+            once all workers are done. '''
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+# Report writer of this crawler process, None unless REPORT_INTERVAL or
+# REPORT_PAGES is set.
+current = None
+
+
+def start(config, collect, progress):
+    global current
+    if current is None and (config.report_interval > 0 or config.report_pages > 0):
+        current = ReportWriter(
+            collect, progress, config.report_interval, config.report_pages)
+        current.start()
+    return current
+
+
+def stop():
+    global current
+    if current is not None:
+        current.stop()
+        current = None
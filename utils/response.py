@@ -1,14 +1,134 @@
+import io
 import pickle
 
+from utils import get_logger
+from utils.metrics import metrics
+
+# The only globals a pickled requests.Response needs. Anything else in a
+# pickle from the cache server is refused instead of being loaded. Protocols
+# 0-2 name the standard modules as in Python 2 and protocol 2 pickles bytes
+# as _codecs.encode calls.
+SAFE_GLOBALS = {
+    ("requests.models", "Response"),
+    ("requests.models", "PreparedRequest"),
+    ("requests.structures", "CaseInsensitiveDict"),
+    ("requests.cookies", "RequestsCookieJar"),
+    ("http.cookiejar", "Cookie"),
+    ("http.cookiejar", "DefaultCookiePolicy"),
+    ("cookielib", "Cookie"),
+    ("cookielib", "DefaultCookiePolicy"),
+    ("collections", "OrderedDict"),
+    ("datetime", "timedelta"),
+    ("datetime", "datetime"),
+    ("copyreg", "_reconstructor"),
+    ("copy_reg", "_reconstructor"),
+    ("_codecs", "encode"),
+    ("builtins", "object"),
+    ("builtins", "set"),
+    ("builtins", "frozenset"),
+    ("builtins", "bytearray"),
+    ("__builtin__", "object"),
+    ("__builtin__", "set"),
+    ("__builtin__", "frozenset"),
+    ("__builtin__", "bytearray"),
+}
+
+# Created on the first response that cannot be decoded
+_logger = None
+
+# raw_response has not been decoded yet
+_UNDECODED = object()
+
+
+class _RestrictedUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) not in SAFE_GLOBALS:
+            raise pickle.UnpicklingError(f"{module}.{name} is not allowed in a response")
+        return super().find_class(module, name)
+
+
+def safe_loads(data):
+    ''' pickle.loads that only loads requests.Response objects. '''
+    return _RestrictedUnpickler(io.BytesIO(data)).load()
+
+
+class RawResponse(object):
+    ''' The parts of a requests.Response the crawler uses, for responses the
+        cache server sent as plain content and headers. '''
+
+    def __init__(self, url, status_code, content, headers):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return str(self.content, "utf-8", errors="replace")
+
+
 class Response(object):
-    def __init__(self, resp_dict):
+    ''' A response from the cache server.
+
+        url, status and error are read right away; status is the status of
+        the page at its origin, cache_status the HTTP status the cache
+        server itself answered with. The page itself is only
+        decoded on first access of raw_response, so responses that are
+        dropped after looking at status never pay for it. The pickle of the
+        requests.Response is loaded with an unpickler that refuses anything
+        but the classes it is made of. If the cache server sends "content"
+        (and "headers") instead, no pickle is involved at all and content
+        is a memoryview of the received bytes. '''
+
+    def __init__(self, resp_dict, cache_status=200):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
+        self.cache_status = cache_status
         self.error = resp_dict["error"] if "error" in resp_dict else None
+        self._pickled = resp_dict.get("response")
+        self._content = resp_dict.get("content")
+        self._headers = resp_dict.get("headers")
+        self._raw_response = _UNDECODED
+
+    @property
+    def raw_response(self):
+        if self._raw_response is _UNDECODED:
+            self._raw_response = self._decode()
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, value):
+        self._raw_response = value
+
+    def _decode(self):
+        if self._content is not None:
+            return RawResponse(self.url, self.status, self._content, self._headers or {})
+        if self._pickled is None:
+            return None
         try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+            with metrics.timer("decode"):
+                return safe_loads(self._pickled)
+        except (pickle.UnpicklingError, TypeError, ValueError, EOFError,
+                AttributeError, ImportError, IndexError) as e:
+            global _logger
+            if _logger is None:
+                _logger = get_logger("RESPONSE", "Worker")
+            _logger.error(f"Could not decode the response of {self.url}: {e}")
+            return None
+
+    @property
+    def content(self):
+        ''' The page body as a memoryview, or None if there is none. '''
+        if self._content is not None:
+            return memoryview(self._content)
+        raw = self.raw_response
+        if raw is None or raw.content is None:
+            return None
+        return memoryview(raw.content)
+
+    @property
+    def headers(self):
+        if self._content is not None:
+            return self._headers or {}
+        raw = self.raw_response
+        return raw.headers if raw is not None else {}
@@ -0,0 +1,228 @@
+import os
+import re
+import json
+import time
+from threading import Lock
+from urllib.parse import urlparse
+
+from utils import get_logger
+
+
+def _compile(pattern):
+    # robots.txt patterns: * matches anything, a trailing $ anchors the end,
+    # everything else is a prefix match
+    anchored = pattern.endswith("$")
+    if anchored:
+        pattern = pattern[:-1]
+    regex = ".*".join(re.escape(part) for part in pattern.split("*"))
+    return re.compile(regex + ("$" if anchored else ""))
+
+
+class RobotsRules(object):
+    ''' The rules of one robots.txt that apply to our user agent.
+        disallow_all is for a robots.txt that could not be fetched. '''
+
+    def __init__(self, text, user_agent, disallow_all=False):
+        self.disallow_all = disallow_all
+        agent = user_agent.lower()
+        # Groups of (agents, lines); consecutive User-agent lines share a group
+        groups, current, in_agents = [], None, False
+        for line in text.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            field, value = (part.strip() for part in line.split(":", 1))
+            field = field.lower()
+            if field == "user-agent":
+                if not in_agents:
+                    current = ([], [])
+                    groups.append(current)
+                    in_agents = True
+                current[0].append(value.lower())
+            elif current is not None:
+                in_agents = False
+                current[1].append((field, value))
+
+        # The most specific group naming our agent, else the * group
+        chosen, chosen_length = [], -1
+        for agents, lines in groups:
+            for name in agents:
+                length = 0 if name == "*" else len(name) if name in agent else -1
+                if length > chosen_length:
+                    chosen, chosen_length = lines, length
+
+        self.rules = []
+        self.crawl_delay = 0.0
+        for field, value in chosen:
+            if field in ("allow", "disallow") and value:
+                self.rules.append((len(value), field == "allow", _compile(value)))
+            elif field == "crawl-delay":
+                try:
+                    self.crawl_delay = float(value)
+                except ValueError:
+                    pass
+        # Longest pattern first, allow before disallow on equal length
+        self.rules.sort(key=lambda rule: (-rule[0], not rule[1]))
+
+    def allowed(self, path):
+        ''' path is the url path plus its query. '''
+        if self.disallow_all:
+            return False
+        for _, allow, pattern in self.rules:
+            if pattern.match(path):
+                return allow
+        return True
+
+
+class RobotsCache(object):
+    ''' robots.txt of every host, fetched once and cached in memory and on
+        disk for ttl seconds.
+
+        fetch(robots_url) returns (status, text). A 4xx status means there
+        are no rules. A 5xx status or a failed fetch means the whole host is
+        disallowed (RFC 9309) until it is fetched again, after a minute
+        instead of ttl. on_delay(host, seconds) is called whenever a host's
+        Crawl-delay becomes known. '''
+
+    def __init__(self, fetch, user_agent, path=None, ttl=86400, on_delay=None):
+        self.logger = get_logger("ROBOTS", "FRONTIER")
+        self.fetch = fetch
+        self.user_agent = user_agent
+        self.path = path
+        self.ttl = ttl
+        self.on_delay = on_delay
+        # host -> (RobotsRules, expires)
+        self.rules = dict()
+        # host -> {"text", "expires", "unreachable"} as saved on disk
+        self.saved = dict()
+        self.lock = Lock()
+        self.host_locks = dict()
+        if path and os.path.exists(path):
+            try:
+                with open(path) as file:
+                    self.saved = json.load(file)
+            except (OSError, ValueError):
+                self.logger.error(f"Could not read robots cache {path}, ignoring it.")
+            now = time.time()
+            for host, entry in self.saved.items():
+                if entry["expires"] > now:
+                    rules = RobotsRules(
+                        entry["text"], user_agent, entry.get("unreachable", False))
+                    self.rules[host] = (rules, entry["expires"])
+
+    def _host_lock(self, host):
+        with self.lock:
+            return self.host_locks.setdefault(host, Lock())
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self.saved, file)
+        os.replace(tmp_path, self.path)
+
+    def _cached(self, host):
+        entry = self.rules.get(host)
+        if entry is not None and entry[1] > time.time():
+            return entry[0]
+        return None
+
+    def get(self, scheme, host):
+        ''' Rules of the host, fetched if needed. Returns (rules, fetched)
+            where fetched tells whether a request was made for them. '''
+        rules = self._cached(host)
+        if rules is not None:
+            return rules, False
+        with self._host_lock(host):
+            # Another worker may have fetched them while we waited
+            rules = self._cached(host)
+            if rules is not None:
+                return rules, False
+            try:
+                status, text = self.fetch(f"{scheme}://{host}/robots.txt")
+            except Exception as e:
+                self.logger.error(f"Failed to fetch robots.txt of {host}: {e}")
+                status, text = None, ""
+            unreachable = status is None or status >= 500
+            if status == 200:
+                ttl = self.ttl
+            else:
+                text = ""
+                ttl = 60 if unreachable else self.ttl
+            rules = RobotsRules(text, self.user_agent, unreachable)
+            expires = time.time() + ttl
+            with self.lock:
+                self.rules[host] = (rules, expires)
+                self.saved[host] = {
+                    "text": text, "expires": expires, "unreachable": unreachable}
+                self._save()
+        if rules.crawl_delay and self.on_delay:
+            self.on_delay(host, rules.crawl_delay)
+        return rules, True
+
+    def allowed(self, url):
+        ''' Whether robots.txt allows the url, fetching it if needed.
+            Returns (allowed, fetched). '''
+        parsed = urlparse(url)
+        rules, fetched = self.get(parsed.scheme or "http", parsed.netloc.lower())
+        path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        return rules.allowed(path), fetched
+
+    def unreachable(self, url):
+        ''' Whether the cached robots.txt of the url's host could not be
+            fetched, so all of the host is disallowed for now. '''
+        rules = self._cached(urlparse(url).netloc.lower())
+        return rules is not None and rules.disallow_all
+
+    def expires_in(self, url):
+        ''' Seconds until the cached robots.txt of the url's host is
+            fetched again, 0 if it is not cached. '''
+        entry = self.rules.get(urlparse(url).netloc.lower())
+        return max(0.0, entry[1] - time.time()) if entry is not None else 0.0
+
+    def allowed_cached(self, url, parsed=None):
+        ''' Like allowed, but never fetches: unknown hosts, and hosts whose
+            robots.txt could not be fetched yet, are allowed. '''
+        if parsed is None:
+            parsed = urlparse(url)
+        rules = self._cached(parsed.netloc.lower())
+        if rules is None or rules.disallow_all:
+            return True
+        path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        return rules.allowed(path)
+
+    def delays(self):
+        ''' Crawl-delay of every cached host that has one. '''
+        return {
+            host: rules.crawl_delay
+            for host, (rules, _) in list(self.rules.items()) if rules.crawl_delay}
+
+
+# robots.txt cache of this crawler process, None until start() is called.
+cache = None
+
+
+def start(config, on_delay=None):
+    ''' Creates the process wide cache, stored next to the save file, that
+        fetches robots.txt through the cache server. Returns None when
+        ROBOTS is off. '''
+    global cache
+    if not config.robots:
+        cache = None
+        return None
+    from utils.download import download
+
+    def fetch(robots_url):
+        resp = download(robots_url, config)
+        if resp.status != 200 or resp.raw_response is None:
+            return resp.status, ""
+        return 200, resp.raw_response.content.decode("utf-8", errors="replace")
+
+    cache = RobotsCache(
+        fetch, config.user_agent, config.save_file + ".robots.json",
+        config.robots_ttl, on_delay)
+    if on_delay:
+        for host, delay in cache.delays().items():
+            on_delay(host, delay)
+    return cache
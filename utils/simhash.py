@@ -0,0 +1,113 @@
+from collections import Counter
+from hashlib import blake2b
+from threading import Lock
+
+BITS = 64
+
+
+def _feature_hash(token):
+    return int.from_bytes(
+        blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(tokens):
+    ''' 64 bit SimHash of the tokens, each weighted by its frequency.
+        Pages that share most of their words get fingerprints that differ
+        in only a few bits. None if there are no tokens of two or more
+        characters, such pages have nothing to compare. '''
+    weights = Counter(token.lower() for token in tokens if len(token) > 1)
+    if not weights:
+        return None
+    # Sum the weights per byte value of every byte position of the feature
+    # hashes, then expand those 8 x 256 sums into the 64 bit sums once. This
+    # keeps the per token work at 8 additions instead of 64.
+    byte_sums = [[0] * 256 for _ in range(8)]
+    for token, weight in weights.items():
+        value = _feature_hash(token)
+        for position in range(8):
+            byte_sums[position][(value >> (8 * position)) & 0xFF] += weight
+    total = sum(weights.values())
+    fingerprint = 0
+    for position in range(8):
+        sums = byte_sums[position]
+        for bit in range(8):
+            mask = 1 << bit
+            set_weight = sum(sums[b] for b in range(256) if b & mask)
+            # The bit is set when the tokens that have it outweigh the rest
+            if 2 * set_weight > total:
+                fingerprint |= 1 << (8 * position + bit)
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex(object):
+    ''' Locality sensitive index of SimHash fingerprints.
+
+        The 64 bits are split into max_distance + 1 bands. Two fingerprints
+        within max_distance bits of each other must agree on at least one
+        whole band, so only fingerprints sharing a band are compared. '''
+
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        assert 0 < bands <= BITS, "max_distance must be between 0 and 63"
+        width = BITS // bands
+        # (shift, mask) of each band, the last band takes the leftover bits
+        self.bands = []
+        for band in range(bands):
+            shift = band * width
+            size = width if band < bands - 1 else BITS - shift
+            self.bands.append((shift, (1 << size) - 1))
+        # One table per band: band value -> fingerprints
+        self.tables = [dict() for _ in self.bands]
+        self.size = 0
+        self.lock = Lock()
+
+    def find(self, fingerprint):
+        ''' Returns an indexed fingerprint within max_distance bits, or None. '''
+        for (shift, mask), table in zip(self.bands, self.tables):
+            for candidate in table.get((fingerprint >> shift) & mask, ()):
+                if hamming_distance(candidate, fingerprint) <= self.max_distance:
+                    return candidate
+        return None
+
+    def add(self, fingerprint):
+        for (shift, mask), table in zip(self.bands, self.tables):
+            table.setdefault((fingerprint >> shift) & mask, []).append(fingerprint)
+        self.size += 1
+
+    def check_and_add(self, fingerprint):
+        ''' Adds the fingerprint unless it is a near duplicate of one already
+            indexed. Returns True if it was a near duplicate. '''
+        with self.lock:
+            if self.find(fingerprint) is not None:
+                return True
+            self.add(fingerprint)
+            return False
+
+    def remove(self, fingerprint):
+        ''' Takes the fingerprint out of the index again, if it is in it. '''
+        with self.lock:
+            shift, mask = self.bands[0]
+            if fingerprint not in self.tables[0].get((fingerprint >> shift) & mask, ()):
+                return
+            for (shift, mask), table in zip(self.bands, self.tables):
+                key = (fingerprint >> shift) & mask
+                table[key].remove(fingerprint)
+                if not table[key]:
+                    del table[key]
+            self.size -= 1
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        # Every fingerprint is in every table, so the first one lists them
+        # all. Copied under the lock, other threads keep adding to it.
+        with self.lock:
+            fingerprints = [
+                fingerprint for band in self.tables[0].values() for fingerprint in band]
+        return iter(fingerprints)
@@ -0,0 +1,91 @@
+from bisect import insort, bisect_left
+from threading import Lock, local
+
+
+class PageStats(object):
+    ''' The statistics of the pages one thread counted since they were last
+        merged: number of pages, longest page, word and subdomain counts.
+
+        Only its own thread adds to it, so its lock is only ever contended
+        for the moment a merge takes the counts away. '''
+
+    def __init__(self):
+        self.lock = Lock()
+        self._clear()
+
+    def _clear(self):
+        self.count = 0
+        self.longest = (None, 0)
+        self.word_counts = dict()
+        self.subdomains = dict()
+
+    def add(self, url, word_count, word_counts, subdomain=None, pages=1):
+        ''' Counts a page. A page counted before is taken out again with
+            pages=-1 and its word counts negated. '''
+        with self.lock:
+            self.count += pages
+            if word_count > self.longest[1]:
+                self.longest = (url, word_count)
+            totals = self.word_counts
+            for word, amount in word_counts.items():
+                totals[word] = totals.get(word, 0) + amount
+            if subdomain is not None:
+                self.subdomains[subdomain] = self.subdomains.get(subdomain, 0) + pages
+            return self.count
+
+    def take(self):
+        ''' Returns (count, longest, word_counts, subdomains) and starts
+            over from zero. '''
+        with self.lock:
+            taken = (self.count, self.longest, self.word_counts, self.subdomains)
+            self._clear()
+        return taken
+
+
+class ThreadStats(object):
+    ''' Hands every thread its own PageStats, so workers count pages without
+        waiting on each other, and collects them all for a merge into the
+        global statistics. '''
+
+    def __init__(self):
+        self.local = local()
+        self.lock = Lock()
+        self.all = []
+
+    def get(self):
+        ''' The PageStats of the calling thread. '''
+        stats = getattr(self.local, "stats", None)
+        if stats is None:
+            stats = self.local.stats = PageStats()
+            with self.lock:
+                self.all.append(stats)
+        return stats
+
+    def take_all(self):
+        ''' Takes the counts of every thread, see PageStats.take. '''
+        with self.lock:
+            all_stats = list(self.all)
+        return [stats.take() for stats in all_stats]
+
+
+class SortedCounts(dict):
+    ''' A dict of counts that keeps its keys sorted as they are added, so
+        reports list them in order without sorting them every time. Only
+        add() may add keys; a count that drops to 0 removes its key. '''
+
+    def __init__(self, counts=()):
+        super().__init__(counts)
+        self.order = sorted(self)
+
+    def add(self, key, amount=1):
+        if key in self:
+            self[key] += amount
+            if self[key] <= 0:
+                del self[key]
+                self.order.pop(bisect_left(self.order, key))
+        elif amount > 0:
+            self[key] = amount
+            insort(self.order, key)
+
+    def sorted_items(self):
+        return [(key, self[key]) for key in self.order]
@@ -0,0 +1,159 @@
+import heapq
+
+
+def _ranked(items, k):
+    # Most frequent first, ties broken alphabetically
+    return heapq.nsmallest(k, items, key=lambda item: (-item[1], item[0]))
+
+
+class ExactCounter(object):
+    ''' Exact counts of every key, plus an incrementally kept candidate set
+        for the top k so top() never has to look at every key.
+
+        Counts mostly grow, so the smallest count among the candidates
+        (threshold) only grows too. A key outside the candidates was at or
+        below the threshold when it was last seen, so it can only enter the
+        top k by being updated, which is when it is checked. A candidate
+        whose count shrinks (a page counted again is taken out first) may
+        fall behind other keys, so the candidates are rebuilt from all
+        counts the next time top() is called. '''
+
+    # Whether the candidates must be rebuilt. A class attribute as well, for
+    # counters pickled in checkpoints before counts could shrink.
+    stale = False
+
+    def __init__(self, k=50):
+        self.k = k
+        self.counts = dict()
+        self.candidates = dict()
+        self.threshold = 0
+        self.stale = False
+
+    def update(self, key, amount=1):
+        count = self.counts.get(key, 0) + amount
+        if amount <= 0:
+            if count > 0:
+                self.counts[key] = count
+            else:
+                self.counts.pop(key, None)
+            if key in self.candidates:
+                self.stale = True
+            return
+        self.counts[key] = count
+        if key in self.candidates or count >= self.threshold or len(self.candidates) < self.k:
+            self.candidates[key] = count
+            if len(self.candidates) > 2 * self.k:
+                kept = _ranked(self.candidates.items(), self.k)
+                self.candidates = dict(kept)
+                self.threshold = kept[-1][1]
+
+    def update_many(self, counts):
+        for key, amount in counts.items():
+            self.update(key, amount)
+
+    def top(self, k=None):
+        ''' The k (at most the k given at construction) most frequent keys
+            and their counts. '''
+        if self.stale:
+            kept = _ranked(self.counts.items(), self.k)
+            self.candidates = dict(kept)
+            self.threshold = kept[-1][1] if len(kept) == self.k else 0
+            self.stale = False
+        return _ranked(self.candidates.items(), min(k or self.k, self.k))
+
+    def get(self, key, default=0):
+        return self.counts.get(key, default)
+
+    def items(self):
+        return self.counts.items()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def copy(self):
+        counter = ExactCounter(self.k)
+        counter.counts = dict(self.counts)
+        counter.candidates = dict(self.candidates)
+        counter.threshold = self.threshold
+        counter.stale = self.stale
+        return counter
+
+
+class SpaceSavingCounter(object):
+    ''' Approximate heavy hitters in bounded memory (Space-Saving algorithm).
+
+        At most capacity keys are tracked. A new key replaces the key with
+        the smallest count and inherits that count as its possible
+        overestimate. Any key with a true count above n / capacity is
+        guaranteed to be tracked, where n is the total of all updates. '''
+
+    def __init__(self, capacity=10000, k=50):
+        self.capacity = capacity
+        self.k = k
+        # key -> [count, overestimate]
+        self.counts = dict()
+        # Lazy min heap of (count, key), entries are stale once the key's
+        # count has moved on
+        self.heap = []
+
+    def _evict(self):
+        while True:
+            count, key = heapq.heappop(self.heap)
+            entry = self.counts.get(key)
+            if entry is not None and entry[0] == count:
+                del self.counts[key]
+                return count
+
+    def update(self, key, amount=1):
+        entry = self.counts.get(key)
+        if amount <= 0:
+            # Only keys that are still tracked can be taken from
+            if entry is not None:
+                entry[0] = max(0, entry[0] + amount)
+                heapq.heappush(self.heap, (entry[0], key))
+            return
+        if entry is None:
+            error = self._evict() if len(self.counts) >= self.capacity else 0
+            entry = self.counts[key] = [error, error]
+        entry[0] += amount
+        heapq.heappush(self.heap, (entry[0], key))
+        if len(self.heap) > 4 * self.capacity:
+            # Drop the stale entries
+            self.heap = [(count, key) for key, (count, _) in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def update_many(self, counts):
+        for key, amount in counts.items():
+            self.update(key, amount)
+
+    def top(self, k=None):
+        return _ranked(
+            ((key, count) for key, (count, _) in self.counts.items()), k or self.k)
+
+    def get(self, key, default=0):
+        entry = self.counts.get(key)
+        return entry[0] if entry is not None else default
+
+    def error(self, key):
+        ''' How much the count of key may be overestimated. '''
+        entry = self.counts.get(key)
+        return entry[1] if entry is not None else 0
+
+    def items(self):
+        return ((key, count) for key, (count, _) in self.counts.items())
+
+    def __len__(self):
+        return len(self.counts)
+
+    def copy(self):
+        counter = SpaceSavingCounter(self.capacity, self.k)
+        counter.counts = {key: list(entry) for key, entry in self.counts.items()}
+        counter.heap = list(self.heap)
+        return counter
+
+
+def make_counter(mode="exact", capacity=10000, k=50):
+    ''' Counter for WORD_COUNT_MODE in config.ini: exact or approximate. '''
+    if mode == "approximate":
+        return SpaceSavingCounter(capacity, k)
+    return ExactCounter(k)
@@ -0,0 +1,103 @@
+import re
+import time
+from threading import Lock
+from urllib.parse import urlparse, parse_qsl
+
+DIGITS_RE = re.compile(r'\d+')
+# Hex ids, hashes and uuids, e.g. 5f2b9c1e or 123e4567-e89b-12d3-a456-...
+ID_RE = re.compile(r'^(?=.*\d)[0-9a-fA-F-]{8,}$')
+
+
+def _collapse(value):
+    # Replace the parts of a path segment or query value that vary between
+    # pages generated from the same template.
+    if ID_RE.match(value):
+        return '<id>'
+    return DIGITS_RE.sub('<n>', value)
+
+
+def url_template(url, parsed=None):
+    ''' Collapses numbers and ids in the url so that urls generated by the
+        same page template (calendars, pagination, revisions) share a key. '''
+    if parsed is None:
+        parsed = urlparse(url)
+    segments = [_collapse(segment) for segment in parsed.path.split('/') if segment]
+    query = sorted(
+        f"{key}={_collapse(value)}"
+        for key, value in parse_qsl(parsed.query, keep_blank_values=True))
+    template = parsed.netloc.lower() + '/' + '/'.join(segments)
+    if query:
+        template += '?' + '&'.join(query)
+    return template
+
+
+class TrapDetector(object):
+    ''' Constant time trap detection by url template.
+
+        Every url added to the frontier counts towards its template. Counts
+        decay with the given half life (seconds), so templates that grow
+        slowly over a crawl are fine while ones that explode (calendars,
+        session ids) go over template_limit and are blocked from then on. '''
+
+    def __init__(self, template_limit=200, half_life=600.0, max_depth=12,
+                 max_repeats=2):
+        self.template_limit = template_limit
+        self.half_life = half_life
+        self.max_depth = max_depth
+        self.max_repeats = max_repeats
+        # template -> [decayed count, last update time]
+        self.counts = dict()
+        # template -> reason it was blocked
+        self.blocked = dict()
+        self.lock = Lock()
+
+    def _structural_reason(self, parsed):
+        # Checks that only need the url itself
+        segments = [segment for segment in parsed.path.split('/') if segment]
+        if len(segments) > self.max_depth:
+            return f"path deeper than {self.max_depth} segments"
+        if len(segments) - len(set(segments)) >= self.max_repeats:
+            return f"path repeats segments {self.max_repeats} or more times"
+        return None
+
+    def is_trap(self, url, parsed=None):
+        if parsed is None:
+            parsed = urlparse(url)
+        if self._structural_reason(parsed):
+            return True
+        return url_template(url, parsed) in self.blocked
+
+    def reason(self, url):
+        ''' Why the url is considered a trap, or None if it is not. '''
+        parsed = urlparse(url)
+        reason = self._structural_reason(parsed)
+        if reason:
+            return reason
+        return self.blocked.get(url_template(url, parsed))
+
+    def get_state(self):
+        ''' Picklable counts and blocked templates, for checkpoints. '''
+        with self.lock:
+            return {
+                "counts": {template: count for template, (count, _) in self.counts.items()},
+                "blocked": dict(self.blocked)}
+
+    def set_state(self, state):
+        now = time.monotonic()
+        with self.lock:
+            self.counts = {
+                template: (count, now) for template, count in state["counts"].items()}
+            self.blocked = dict(state["blocked"])
+
+    def record(self, url, parsed=None):
+        ''' Counts a url that is about to be crawled against its template. '''
+        template = url_template(url, parsed)
+        now = time.monotonic()
+        with self.lock:
+            count, last = self.counts.get(template, (0.0, now))
+            count = count * 0.5 ** ((now - last) / self.half_life) + 1
+            self.counts[template] = (count, now)
+            if count > self.template_limit and template not in self.blocked:
+                self.blocked[template] = (
+                    f"more than {self.template_limit} urls "
+                    f"(half life {self.half_life:g}s)")
@@ -0,0 +1,68 @@
+import re
+from urllib.parse import urlparse
+
+from utils.canonical import canonicalize_many
+
+# Rules used when config.ini has no [FILTER] section.
+DEFAULT_SCHEMES = ("http", "https")
+DEFAULT_DOMAINS = ("ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu")
+DEFAULT_EXTENSIONS = (
+    "css", "js", "bmp", "gif", "jpg", "jpeg", "ico", "png", "tif", "tiff",
+    "mid", "mp2", "mp3", "mp4", "wav", "avi", "mov", "mpeg", "ram", "m4v",
+    "mkv", "ogg", "ogv", "pdf", "ps", "eps", "tex", "ppt", "pptx", "doc",
+    "docx", "xls", "xlsx", "names", "data", "dat", "exe", "bz2", "tar", "msi",
+    "bin", "7z", "psd", "dmg", "iso", "epub", "dll", "cnf", "tgz", "sha1",
+    "thmx", "mso", "arff", "rtf", "jar", "csv", "rm", "smil", "wmv", "swf",
+    "wma", "zip", "rar", "gz")
+DEFAULT_BLOCKED = ("filter",)
+
+
+class UrlFilter(object):
+    ''' The static rules of is_valid, compiled once.
+
+        Domains are matched by looking up each suffix of the host in a set
+        (so www.vision.ics.uci.edu checks www.vision.ics.uci.edu,
+        vision.ics.uci.edu, ics.uci.edu, ...), extensions by a set lookup of
+        the last path segment's extension and blocked substrings by one
+        compiled regex. '''
+
+    def __init__(self, domains=DEFAULT_DOMAINS, extensions=DEFAULT_EXTENSIONS,
+                 blocked=DEFAULT_BLOCKED, schemes=DEFAULT_SCHEMES):
+        self.domains = frozenset(domain.lower().strip(".") for domain in domains)
+        self.extensions = frozenset(extension.lower().lstrip(".") for extension in extensions)
+        self.schemes = frozenset(schemes)
+        self.blocked = (
+            re.compile("|".join(re.escape(part) for part in blocked)) if blocked else None)
+
+    def allows_domain(self, host):
+        host = host.lower().rsplit("@", 1)[-1].split(":", 1)[0]
+        while host:
+            if host in self.domains:
+                return True
+            dot = host.find(".")
+            if dot < 0:
+                return False
+            host = host[dot + 1:]
+        return False
+
+    def allows_extension(self, path):
+        segment = path.rsplit("/", 1)[-1]
+        dot = segment.rfind(".")
+        return dot < 0 or segment[dot + 1:].lower() not in self.extensions
+
+    def allows(self, url, parsed=None):
+        ''' True if the url passes all static rules. '''
+        if parsed is None:
+            parsed = urlparse(url)
+        return (
+            parsed.scheme in self.schemes
+            and self.allows_domain(parsed.netloc)
+            and self.allows_extension(parsed.path)
+            and (self.blocked is None or self.blocked.search(url) is None))
+
+    def filter_links(self, links):
+        ''' Returns (canonical url, parsed url) for the links of a page that
+            pass the static rules, without duplicates and in order. '''
+        return [
+            (url, parsed) for url, parsed in canonicalize_many(links)
+            if self.allows(url, parsed)]